@@ -0,0 +1,117 @@
+"""Free-spot allocator kept up to date by the store.
+
+Spots are grouped by (zone, type). Each group keeps its set of free spots, a
+min-heap ordering them by spot number (lowest number is the best spot, i.e.
+nearest the entrance) and running totals, so picking a spot is O(log n) and
+occupancy counts are O(groups) instead of a scan of the lot.
+"""
+import heapq
+
+DEFAULT_ZONE = "main"
+DEFAULT_TYPE = "standard"
+
+
+def spot_group(card):
+    return card.get("zone") or DEFAULT_ZONE, card.get("type") or DEFAULT_TYPE
+
+
+class SpotGroup:
+    __slots__ = ("free", "heap", "total", "occupied")
+
+    def __init__(self):
+        self.free = set()
+        self.heap = []
+        self.total = 0
+        self.occupied = 0
+
+    def push(self, card_id, card):
+        if card_id not in self.free:
+            self.free.add(card_id)
+            number = card.get("id")
+            rank = (0, number, card_id) if type(number) is int else (1, 0, card_id)
+            heapq.heappush(self.heap, (rank, card_id))
+            self.compact()
+
+    def compact(self):
+        # Entries for spots taken since they were pushed are dropped lazily,
+        # and a spot freed again is pushed again; rebuild once stale and
+        # repeated entries outnumber the free spots.
+        if len(self.heap) > 2 * len(self.free) + 64:
+            self.heap[:] = {entry for entry in self.heap if entry[1] in self.free}
+            heapq.heapify(self.heap)
+
+    def pick(self, exclude=()):
+        # Returns the best (rank, card_id) entry not in `exclude`, or None.
+        heap = self.heap
+        while heap and heap[0][1] not in self.free:
+            heapq.heappop(heap)
+        self.compact()
+        skipped = []
+        while heap and (heap[0][1] not in self.free or heap[0][1] in exclude):
+            entry = heapq.heappop(heap)
+            if entry[1] in self.free:
+                skipped.append(entry)
+        best = heap[0] if heap else None
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return best
+
+
+class Allocator:
+    def __init__(self):
+        self.groups = {}
+
+    def load(self, cards):
+        self.groups = {}
+        for card_id, card in cards:
+            self.apply(card_id, None, card)
+
+    def apply(self, card_id, old, new):
+        if old is not None:
+            group = self.groups[spot_group(old)]
+            group.total -= 1
+            if old.get("status") == "occupied":
+                group.occupied -= 1
+            group.free.discard(card_id)
+            if not group.total:
+                del self.groups[spot_group(old)]
+        group = self.groups.get(spot_group(new))
+        if group is None:
+            group = self.groups[spot_group(new)] = SpotGroup()
+        group.total += 1
+        if new.get("status") == "occupied":
+            group.occupied += 1
+        elif new.get("status") == "empty":
+            group.push(card_id, new)
+
+    def pick(self, zone=None, spot_type=None, exclude=()):
+        # Best free spot in the matching groups that is not in `exclude`, or
+        # None when there is none.
+        best = None
+        for (group_zone, group_type), group in self.groups.items():
+            if zone is not None and group_zone != zone:
+                continue
+            if spot_type is not None and group_type != spot_type:
+                continue
+            entry = group.pick(exclude)
+            if entry is not None and (best is None or entry < best):
+                best = entry
+        return best[1] if best is not None else None
+
+    def is_free(self, card_id):
+        return any(card_id in group.free for group in self.groups.values())
+
+    def free_spots(self):
+        for group in self.groups.values():
+            yield from group.free
+
+    def occupancy(self):
+        zones = {}
+        total = occupied = free = 0
+        for (zone, spot_type), group in sorted(self.groups.items()):
+            zones.setdefault(zone, {})[spot_type] = {
+                "total": group.total, "occupied": group.occupied, "free": len(group.free)}
+            total += group.total
+            occupied += group.occupied
+            free += len(group.free)
+        return {"total": total, "occupied": occupied, "free": free, "zones": zones}
@@ -0,0 +1,119 @@
+"""Occupancy reports over the session log, computed with NumPy.
+
+Times are microseconds since 1970 in naive local time (see sessions.py).
+Every report works on whole columns: sessions are selected with boolean
+masks, and occupancy over time uses the sorted entry and exit times with
+their prefix sums. The area under the occupancy curve up to time t is
+
+    sum(t - entry for entries before t) - sum(t - exit for exits before t)
+
+so any number of time slots costs one searchsorted per column instead of a
+pass over the sessions per slot. Slots are hourly, so a report covers at
+most RANGE_MAX.
+"""
+import numpy as np
+
+from spots import decode_time
+
+HOUR = 3600 * 10 ** 6
+DAY = 24 * HOUR
+MINUTE = 60 * 10 ** 6
+DWELL_BINS = (0, 15, 30, 60, 120, 240, 480, 1440)
+# Longest range a report covers: about 88k hourly slots
+RANGE_MAX = 3660 * DAY
+
+
+class Timeline:
+    """Occupancy over time for one set of sessions."""
+
+    def __init__(self, entries, exits, origin):
+        self.entries = np.sort(entries)
+        self.exits = np.sort(exits)
+        # Prefix sums are in float seconds from `origin` (the start of the
+        # report) so millions of rows stay well within float precision.
+        self.origin = origin
+        self.entry_sums = np.concatenate(([0.0], np.cumsum((self.entries - origin) / 1e6)))
+        self.exit_sums = np.concatenate(([0.0], np.cumsum((self.exits - origin) / 1e6)))
+
+    def occupied(self, times):
+        # Cars parked at each of `times` (entry inclusive, exit exclusive).
+        return (np.searchsorted(self.entries, times, side="right")
+                - np.searchsorted(self.exits, times, side="right"))
+
+    def area(self, times):
+        # Car-seconds parked before each of `times`.
+        seconds = (np.asarray(times) - self.origin) / 1e6
+        entered = np.searchsorted(self.entries, times, side="left")
+        left = np.searchsorted(self.exits, times, side="left")
+        return (entered * seconds - self.entry_sums[entered]) - (left * seconds - self.exit_sums[left])
+
+    def peak(self, start, end):
+        # (cars, time) at the busiest moment in [start, end). Occupancy only
+        # rises at an entry, so those (and start) are the only candidates.
+        low, high = np.searchsorted(self.entries, (start, end))
+        times = np.concatenate(([start], self.entries[low:high]))
+        counts = self.occupied(times)
+        best = int(np.argmax(counts))
+        return int(counts[best]), int(times[best])
+
+
+def report(columns, keys, start, end, spots, dwell_bins=DWELL_BINS):
+    # columns are SessionLog.snapshot() arrays; start and end bound the
+    # range in microseconds and spots is the size of the lot. A missing
+    # bound defaults to the sessions' extent, cut to RANGE_MAX; raises
+    # ValueError for a range longer than that.
+    entries, exits, spot = columns["entry"], columns["exit"], columns["spot"]
+    first = int(entries.min()) if len(entries) else 0
+    last = int(exits.max()) + 1 if len(exits) else first
+    if start is None:
+        start = max(first, (last if end is None else end) - RANGE_MAX)
+    if end is None:
+        end = max(min(last, start + RANGE_MAX), start)
+    if end - start > RANGE_MAX:
+        raise ValueError(f"from and to must be at most {RANGE_MAX // DAY} days apart")
+    start -= start % HOUR
+    end = max(end, start + HOUR)
+    end += -end % HOUR
+
+    # Sessions completed in the range drive dwell and turnover; sessions
+    # overlapping it drive occupancy.
+    completed = (exits >= start) & (exits < end)
+    overlapping = (entries < end) & (exits > start)
+    dwell = (exits[completed] - entries[completed]) / MINUTE
+    edges = np.array(list(dwell_bins) + [np.inf], dtype=float)
+    histogram, _ = np.histogram(dwell, bins=edges)
+
+    timeline = Timeline(entries[overlapping], exits[overlapping], start)
+    bounds = np.arange(start, end + 1, HOUR)
+    hourly = np.diff(timeline.area(bounds)) / 3600
+    hours = (bounds[:-1] // HOUR) % 24
+    by_hour = np.bincount(hours, weights=hourly, minlength=24) / np.maximum(np.bincount(hours, minlength=24), 1)
+    peak_cars, peak_time = timeline.peak(start, end)
+    days = (end - start) / DAY
+    busiest = np.bincount(spot[completed], minlength=len(keys)) if len(keys) else np.zeros(0, int)
+
+    return {
+        "from": decode_time(start),
+        "to": decode_time(end),
+        "sessions": int(completed.sum()),
+        "dwell": {
+            "bins": [{"minMinutes": int(low), "maxMinutes": None if high == np.inf else int(high), "count": int(count)}
+                     for low, high, count in zip(edges[:-1], edges[1:], histogram)],
+            "meanMinutes": round(float(dwell.mean()), 2) if len(dwell) else None,
+            "medianMinutes": round(float(np.median(dwell)), 2) if len(dwell) else None,
+            "p90Minutes": round(float(np.percentile(dwell, 90)), 2) if len(dwell) else None,
+        },
+        "hourlyOccupancy": [round(float(cars), 3) for cars in by_hour],
+        "turnover": {
+            "perSpotPerDay": round(int(completed.sum()) / spots / days, 3) if spots else None,
+            "busiestSpots": [{"cardId": keys[i], "sessions": int(busiest[i])}
+                             for i in np.argsort(-busiest, kind="stable")[:5] if busiest[i]],
+        },
+        "peak": {
+            "cars": peak_cars,
+            "time": decode_time(peak_time),
+            "occupancy": round(peak_cars / spots, 3) if spots else None,
+            "hourOfDay": int(np.argmax(by_hour)),
+            "busiestHour": {"time": decode_time(int(bounds[np.argmax(hourly)])), "averageCars": round(float(hourly.max()), 3)},
+        },
+    }
@@ -1,572 +1,658 @@
-from flask import Flask, render_template_string, jsonify, request
-from flask_cors import CORS
-from datetime import datetime
-
-app = Flask(__name__)
-CORS(app)
-
-# In-memory database
-# Keyed by ID as strings to match frontend expectation
-cards_data = {
-    "1": {"id": 1, "status": "empty", "vehicle": "None", "entryTime": None},
-    "2": {"id": 2, "status": "occupied", "vehicle": "KA-53-Z-9021", "entryTime": datetime.now().isoformat()},
-    "3": {"id": 3, "status": "empty", "vehicle": "None", "entryTime": None}
-}
-
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>SmartPark | Enterprise Parking</title>
-    <!-- Tailwind CSS -->
-    <script src="https://cdn.tailwindcss.com"></script>
-    <!-- Google Fonts: Inter -->
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-    <!-- Phosphor Icons -->
-    <script src="https://unpkg.com/@phosphor-icons/web"></script>
-    
-    <script>
-        tailwind.config = {
-            theme: {
-                extend: {
-                    fontFamily: {
-                        sans: ['Inter', 'sans-serif'],
-                    },
-                    colors: {
-                        slate: {
-                            850: '#1e293b', // Custom dark shade
-                        }
-                    }
-                }
-            }
-        }
-    </script>
-    
-    <style>
-        body {
-            background-color: #f8fafc; /* Slate-50 */
-            background-image: radial-gradient(#cbd5e1 1px, transparent 1px);
-            background-size: 24px 24px;
-            color: #0f172a; /* Slate-900 */
-        }
-        .glass-header {
-            background: #0f172a; /* Slate-900 */
-            backdrop-filter: blur(12px);
-        }
-        .card-tech {
-            background: white;
-            border: 1px solid #e2e8f0; /* Slate-200 */
-            box-shadow: 0 1px 2px 0 rgba(0, 0, 0, 0.05); /* shadow-sm */
-            border-radius: 0.5rem; /* rounded-lg */
-            transition: all 0.2s ease-in-out;
-        }
-        .card-tech:hover {
-            border-color: #cbd5e1; /* Slate-300 */
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06); /* shadow-md */
-        }
-        .fade-in {
-            animation: fadeIn 0.3s cubic-bezier(0.4, 0, 0.2, 1) forwards;
-        }
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(5px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-    </style>
-</head>
-<body class="min-h-screen flex flex-col antialiased">
-
-    <!-- Solid Dark Header -->
-    <nav class="sticky top-0 z-50 glass-header border-b border-slate-700">
-        <div class="max-w-5xl mx-auto px-6 h-16 flex items-center justify-between">
-            <div class="flex items-center gap-3 cursor-pointer group" onclick="navigateHome()">
-                <!-- Simple Monogram Logo -->
-                <div class="w-10 h-10 bg-slate-800 rounded-lg flex items-center justify-center border border-slate-700 shadow-sm group-hover:bg-slate-700 transition-colors">
-                    <span class="text-white font-bold text-lg tracking-tight">SP</span>
-                </div>
-                <span class="font-bold text-xl tracking-tight text-white">SmartPark</span>
-            </div>
-            <div class="flex items-center gap-4">
-                 <div id="connectionStatus" class="w-2 h-2 rounded-full bg-red-500 animate-pulse" title="System Status"></div>
-                 <button id="logoutBtn" class="hidden text-xs font-bold bg-slate-800 hover:bg-slate-700 px-4 py-2 rounded-lg border border-slate-700 transition-colors text-white uppercase tracking-wider">Log Out</button>
-            </div>
-        </div>
-    </nav>
-
-    <!-- Main Container -->
-    <main class="flex-grow w-full max-w-5xl mx-auto p-6 md:p-12 relative">
-        <div id="app" class="w-full"></div>
-    </main>
-    
-    <!-- Footer -->
-    <footer class="py-10 border-t border-slate-200 mt-auto bg-white/50 backdrop-blur-sm">
-         <div class="max-w-5xl mx-auto px-6 flex justify-between items-center text-sm text-slate-500">
-            <p>&copy; SmartPark Systems</p>
-            <div class="flex gap-4">
-                <a href="#" class="hover:text-slate-800">Privacy</a>
-                <a href="#" class="hover:text-slate-800">Status</a>
-                <a href="#" class="hover:text-slate-800">API</a>
-            </div>
-         </div>
-    </footer>
-
-    <!-- JavaScript Strategy -->
-    <script>
-        // --- State ---
-        let cardsData = {};
-        const AUTH_KEY = 'smartpark_pro_auth';
-        let isPolling = false;
-
-        // --- Core Logic ---
-        async function fetchStatus() {
-            try {
-                const res = await fetch('/api/status');
-                if (!res.ok) throw new Error('Network err');
-                const newCardsData = await res.json();
-
-                const statusEl = document.getElementById('connectionStatus');
-                statusEl.className = "w-2 h-2 rounded-full bg-emerald-500 shadow-[0_0_10px_rgba(16,185,129,0.5)] transition-colors duration-300";
-                
-                // Deep compare to prevent stutter
-                if (JSON.stringify(cardsData) !== JSON.stringify(newCardsData)) {
-                    cardsData = newCardsData;
-                    render();
-                }
-
-            } catch (e) {
-                console.error("Sync Error", e);
-                const statusEl = document.getElementById('connectionStatus');
-                statusEl.className = "w-2 h-2 rounded-full bg-red-500 animate-pulse";
-            }
-        }
-
-        async function updateCard(cardId, action, payload = {}) {
-            try {
-                const res = await fetch('/api/update', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ cardId, action, ...payload })
-                });
-                const data = await res.json();
-                if (data.error) alert(data.error);
-                else {
-                    await fetchStatus();
-                    navigateHome();
-                }
-            } catch (e) {
-                alert("Operation failed.");
-            }
-        }
-
-        function init() {
-            fetchStatus();
-            setInterval(fetchStatus, 2000); 
-            window.addEventListener('popstate', render);
-            render();
-            checkAuth();
-        }
-
-        function isLoggedIn() { return sessionStorage.getItem(AUTH_KEY) === 'true'; }
-
-        function checkAuth() {
-            const btn = document.getElementById('logoutBtn');
-            if (isLoggedIn()) {
-                btn.classList.remove('hidden');
-                btn.onclick = () => { sessionStorage.removeItem(AUTH_KEY); window.location.reload(); };
-            } else {
-                btn.classList.add('hidden');
-            }
-        }
-
-        function navigateHome() {
-            history.pushState(null, '', '/');
-            render();
-        }
-        
-        function navigateToLogin() {
-            history.pushState(null, '', '?view=login');
-            render();
-        }
-
-        function navigateToCard(id) {
-            history.pushState(null, '', `?card=${id}`);
-            render();
-        }
-
-        function render() {
-            const urlParams = new URLSearchParams(window.location.search);
-            const cardId = urlParams.get('card');
-            const view = urlParams.get('view');
-            const app = document.getElementById('app');
-
-            if (document.activeElement && document.activeElement.tagName === 'INPUT') return;
-
-            if (cardId) {
-                if (isLoggedIn()) renderManagerScan(app, cardId);
-                else renderPublicScan(app, cardId);
-            } else {
-                if (isLoggedIn()) renderManagerDashboard(app);
-                else if (view === 'login') renderLogin(app);
-                else renderLanding(app);
-            }
-        }
-
-        // --- Views ---
-
-        function renderLanding(container) {
-            container.innerHTML = `
-                <div class="fade-in max-w-4xl mx-auto py-10">
-                    <div class="text-center mb-16">
-                        <div class="inline-flex items-center gap-2 px-3 py-1 rounded-full bg-indigo-50 border border-indigo-100 text-indigo-700 text-xs font-bold uppercase tracking-wide mb-6">
-                            <span class="w-1.5 h-1.5 rounded-full bg-indigo-600"></span> Beta 2.0
-                        </div>
-                        <h1 class="text-5xl md:text-6xl font-extrabold text-slate-900 tracking-tight leading-tight mb-6">
-                            Parking Intelligence <br>
-                            <span class="text-slate-400">for Modern Cities.</span>
-                        </h1>
-                        <p class="text-lg text-slate-500 max-w-lg mx-auto leading-relaxed mb-10">
-                            The enterprise-grade solution for vehicle management. Secure, fast, and built for scale.
-                        </p>
-                        
-                        <div class="flex flex-col items-center gap-6">
-                            <button onclick="navigateToLogin()" class="w-full max-w-xs bg-slate-900 hover:bg-black text-white px-8 py-4 rounded-xl font-bold shadow-lg shadow-slate-900/10 transition-all text-sm flex items-center justify-center gap-2 transform hover:-translate-y-1">
-                                Access Console <i class="ph-bold ph-arrow-right"></i>
-                            </button>
-                            
-                            <div class="flex items-center gap-0 divide-x divide-slate-100 bg-white p-1.5 rounded-xl border border-slate-200 shadow-sm">
-                                <span class="text-[10px] font-bold text-slate-400 uppercase tracking-wider px-3">Public Sim</span>
-                                <div class="flex items-center px-1">
-                                    ${[1, 2, 3].map(id => `
-                                        <button onclick="navigateToCard(${id})" class="text-slate-500 hover:text-indigo-600 hover:bg-slate-50 font-bold text-sm w-8 h-8 rounded-lg transition-colors flex items-center justify-center">${id}</button>
-                                    `).join('')}
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-
-                    <!-- Feature Grid -->
-                    <div class="grid md:grid-cols-3 gap-6">
-                        <div class="card-tech p-6">
-                            <div class="w-10 h-10 bg-indigo-50 rounded-lg flex items-center justify-center text-indigo-600 mb-4 border border-indigo-100">
-                                <i class="ph-bold ph-shield-check text-xl"></i>
-                            </div>
-                            <h3 class="font-bold text-slate-900 mb-2">Enterprise Security</h3>
-                            <p class="text-sm text-slate-500 leading-relaxed">
-                                Bank-grade encryption for all vehicle data and transaction logs.
-                            </p>
-                        </div>
-                        <div class="card-tech p-6">
-                            <div class="w-10 h-10 bg-emerald-50 rounded-lg flex items-center justify-center text-emerald-600 mb-4 border border-emerald-100">
-                                <i class="ph-bold ph-lightning text-xl"></i>
-                            </div>
-                            <h3 class="font-bold text-slate-900 mb-2">Lightning Fast</h3>
-                            <p class="text-sm text-slate-500 leading-relaxed">
-                                Sub-millisecond response times for check-ins and check-outs.
-                            </p>
-                        </div>
-                        <div class="card-tech p-6">
-                            <div class="w-10 h-10 bg-blue-50 rounded-lg flex items-center justify-center text-blue-600 mb-4 border border-blue-100">
-                                <i class="ph-bold ph-chart-line-up text-xl"></i>
-                            </div>
-                            <h3 class="font-bold text-slate-900 mb-2">Real-time Analytics</h3>
-                            <p class="text-sm text-slate-500 leading-relaxed">
-                                Live dashboard updates with zero latency and high precision.
-                            </p>
-                        </div>
-                    </div>
-                </div>
-            `;
-        }
-
-        function renderLogin(container) {
-            container.innerHTML = `
-                <div class="fade-in max-w-sm mx-auto mt-10">
-                    <div class="card-tech border-t-4 border-t-indigo-500 p-8 shadow-lg">
-                        <h2 class="text-xl font-bold text-slate-900 mb-1">Authenticated Access</h2>
-                        <p class="text-sm text-slate-500 mb-6">Restricted to authorized personnel only.</p>
-
-                        <form onsubmit="handleLogin(event)" class="space-y-4">
-                            <div>
-                                <label class="text-xs font-bold text-slate-700 uppercase tracking-wide block mb-1.5">Identity</label>
-                                <input type="text" id="username" class="w-full bg-slate-50 border border-slate-300 rounded-lg px-3 py-2.5 text-slate-900 focus:bg-white focus:border-indigo-500 focus:ring-1 focus:ring-indigo-500 outline-none transition-all text-sm font-medium" placeholder="admin">
-                            </div>
-                            <div>
-                                <label class="text-xs font-bold text-slate-700 uppercase tracking-wide block mb-1.5">Key</label>
-                                <input type="password" id="password" class="w-full bg-slate-50 border border-slate-300 rounded-lg px-3 py-2.5 text-slate-900 focus:bg-white focus:border-indigo-500 focus:ring-1 focus:ring-indigo-500 outline-none transition-all text-sm font-medium" placeholder="••••">
-                            </div>
-                            <button type="submit" class="w-full bg-slate-900 hover:bg-black text-white font-bold py-2.5 rounded-lg text-sm transition-colors shadow-sm">
-                                Authenticate
-                            </button>
-                        </form>
-                    </div>
-                     <button onclick="navigateHome()" class="w-full mt-6 text-xs font-bold text-slate-400 hover:text-slate-600 uppercase tracking-wider">Cancel Navigation</button>
-                </div>
-            `;
-        }
-
-        function handleLogin(e) {
-            e.preventDefault();
-            const u = document.getElementById('username').value;
-            const p = document.getElementById('password').value;
-            if (u === 'admin' && p === '123') {
-                sessionStorage.setItem(AUTH_KEY, 'true');
-                checkAuth();
-                render();
-            } else {
-                alert('Access Denied.');
-            }
-        }
-
-        function renderManagerDashboard(container) {
-            let html = `
-                <div class="fade-in">
-                    <div class="flex items-end justify-between mb-6">
-                        <div>
-                            <h2 class="text-2xl font-bold text-slate-900 tracking-tight">Overview</h2>
-                            <p class="text-sm text-slate-500 font-medium">Facility status and controls</p>
-                        </div>
-                        <div class="flex gap-2">
-                             <span class="px-3 py-1 bg-white border border-slate-200 rounded-md text-xs font-bold text-slate-600 shadow-sm">
-                                Total Spots: 3
-                             </span>
-                        </div>
-                    </div>
-                    
-                    <div class="grid md:grid-cols-4 gap-6">
-                        <!-- Sidebar / Stats -->
-                        <div class="hidden md:block space-y-4">
-                            <div class="card-tech p-4">
-                                <p class="text-xs font-bold text-slate-400 uppercase mb-1">Occupancy</p>
-                                <div class="text-3xl font-bold text-slate-900">${Object.values(cardsData).filter(c => c.status === 'occupied').length} <span class="text-slate-300 text-lg">/ 3</span></div>
-                            </div>
-                             <div class="card-tech p-4 bg-slate-50 border-slate-200/50">
-                                <p class="text-xs font-bold text-slate-400 uppercase mb-2">Recent Activity</p>
-                                <div class="space-y-3">
-                                    <div class="flex items-center gap-2 text-xs text-slate-500">
-                                        <div class="w-1.5 h-1.5 rounded-full bg-emerald-400"></div> System Online
-                                    </div>
-                                </div>
-                            </div>
-                        </div>
-
-                        <!-- Main Grid -->
-                        <div class="md:col-span-3 grid sm:grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
-            `;
-
-            const ids = [1, 2, 3];
-            ids.forEach(id => {
-                const card = cardsData[id.toString()] || { id: id, status: 'unknown' };
-                const isOcc = card.status === 'occupied';
-                
-                html += `
-                    <div class="card-tech p-5 flex flex-col justify-between h-48 relative overflow-hidden group ${isOcc ? 'border-l-4 border-l-emerald-500' : 'border-l-4 border-l-slate-200'}">
-                        <div>
-                            <div class="flex justify-between items-start mb-3">
-                                <span class="font-mono text-xs font-bold text-slate-400">#00${id}</span>
-                                <span class="px-2 py-0.5 rounded text-[10px] font-bold uppercase tracking-wide border ${
-                                    isOcc 
-                                    ? 'bg-emerald-50 text-emerald-700 border-emerald-100' 
-                                    : 'bg-slate-50 text-slate-500 border-slate-100'
-                                }">
-                                    ${card.status === 'unknown' ? 'SYNC' : (isOcc ? 'Active' : 'Idle')}
-                                </span>
-                            </div>
-                            <h3 class="text-lg font-bold text-slate-800 mb-1">
-                                ${isOcc ? card.vehicle : 'Available'}
-                            </h3>
-                            ${isOcc ? `
-                                <p class="text-xs text-slate-500 font-mono">
-                                    ${new Date(card.entryTime).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}
-                                </p>
-                            ` : ''}
-                        </div>
-
-                        <button onclick="navigateToCard(${id})" class="mt-4 w-full py-2 rounded border border-slate-200 bg-white text-slate-600 text-xs font-bold uppercase hover:bg-slate-50 hover:border-slate-300 transition-all flex items-center justify-center gap-2">
-                            ${isOcc ? 'View Details' : 'Initiate Entry'}
-                        </button>
-                    </div>
-                `;
-            });
-            html += `</div></div></div>`;
-            container.innerHTML = html;
-        }
-
-        function renderManagerScan(container, cardId) {
-            const card = cardsData[cardId];
-            if (!card) return container.innerHTML = renderLoader();
-
-            // Check In
-            if (card.status === 'empty') {
-                container.innerHTML = `
-                    <div class="fade-in max-w-lg mx-auto mt-8">
-                         <div class="flex items-center gap-4 mb-6">
-                            <button onclick="navigateHome()" class="w-8 h-8 flex items-center justify-center rounded-full border border-slate-200 text-slate-500 hover:bg-white transition-colors">
-                                <i class="ph-bold ph-arrow-left"></i>
-                            </button>
-                            <h2 class="text-xl font-bold text-slate-900">Entry Protocol <span class="text-slate-400">#${cardId}</span></h2>
-                         </div>
-
-                        <div class="card-tech p-8 border-t-4 border-t-indigo-500 shadow-md bg-white">
-                             <div class="space-y-6">
-                                 <div>
-                                    <label class="block text-xs font-bold text-slate-700 uppercase tracking-wide mb-2">Vehicle Registration</label>
-                                    <input id="vIn" type="text" class="w-full bg-slate-50 border border-slate-300 rounded-lg p-3 text-lg font-mono uppercase text-slate-900 placeholder-slate-400 focus:bg-white focus:border-indigo-500 focus:ring-1 focus:ring-indigo-500 outline-none transition-all" placeholder="KA-05-XY-1234">
-                                 </div>
-                                 
-                                 <div>
-                                    <label class="block text-xs font-bold text-slate-700 uppercase tracking-wide mb-2">Contact (Optional)</label>
-                                    <input id="pIn" type="tel" class="w-full bg-slate-50 border border-slate-300 rounded-lg p-3 text-slate-900 placeholder-slate-400 focus:bg-white focus:border-indigo-500 focus:ring-1 focus:ring-indigo-500 outline-none transition-all" placeholder="98765...">
-                                 </div>
-
-                                 <button onclick="handleCheckIn(${cardId})" class="w-full bg-indigo-600 hover:bg-indigo-700 text-white font-bold py-3 rounded-lg shadow-sm transition-all flex items-center justify-center gap-2 mt-2">
-                                    <i class="ph-bold ph-check"></i>
-                                    Authorize Entry
-                                 </button>
-                             </div>
-                        </div>
-                    </div>
-                `;
-            } 
-            // Check Out
-            else {
-                const diff = card.entryTime ? Math.round((new Date() - new Date(card.entryTime)) / 60000) : 0;
-                const cost = Math.max(50, diff * 1);
-
-                container.innerHTML = `
-                    <div class="fade-in max-w-lg mx-auto mt-8">
-                         <div class="flex items-center gap-4 mb-6">
-                            <button onclick="navigateHome()" class="w-8 h-8 flex items-center justify-center rounded-full border border-slate-200 text-slate-500 hover:bg-white transition-colors">
-                                <i class="ph-bold ph-arrow-left"></i>
-                            </button>
-                            <h2 class="text-xl font-bold text-slate-900">Exit Protocol <span class="text-slate-400">#${cardId}</span></h2>
-                         </div>
-
-                        <div class="card-tech p-0 border-t-4 border-t-emerald-500 shadow-md bg-white overflow-hidden">
-                             <div class="p-6 bg-slate-50 border-b border-slate-100 flex justify-between items-center">
-                                <div>
-                                    <p class="text-xs font-bold text-slate-500 uppercase mb-1">Vehicle</p>
-                                    <h3 class="text-2xl font-mono font-bold text-slate-900">${card.vehicle}</h3>
-                                </div>
-                                <div class="text-right">
-                                    <p class="text-xs font-bold text-slate-500 uppercase mb-1">Duration</p>
-                                    <p class="text-lg font-bold text-indigo-600">${diff}m</p>
-                                </div>
-                             </div>
-                             
-                             <div class="p-8">
-                                <div class="flex justify-between items-end mb-8">
-                                    <span class="text-sm font-bold text-slate-500">Total Due</span>
-                                    <span class="text-4xl font-bold text-slate-900 tracking-tight">₹${cost}</span>
-                                </div>
-
-                                <button onclick="handleCheckOut(${cardId})" class="w-full bg-slate-900 hover:bg-black text-white font-bold py-3 rounded-lg shadow-sm transition-all flex items-center justify-center gap-2">
-                                    <i class="ph-bold ph-receipt"></i>
-                                    Process Payment & Release
-                                </button>
-                             </div>
-                        </div>
-                    </div>
-                `;
-            }
-        }
-
-        function handleCheckIn(id) {
-            const v = document.getElementById('vIn').value;
-            const p = document.getElementById('pIn').value;
-            if (!v) return alert("Registration Required");
-            updateCard(id, 'checkin', { vehicle: v, phone: p });
-        }
-
-        function handleCheckOut(id) {
-            if (confirm("Confirm Payment & Exit?")) {
-                updateCard(id, 'checkout');
-            }
-        }
-
-        function renderPublicScan(container, cardId) {
-            const card = cardsData[cardId];
-            if (!card) return container.innerHTML = renderLoader();
-
-            if (card.status === 'empty') {
-                container.innerHTML = `
-                    <div class="fade-in text-center mt-20 px-6 max-w-md mx-auto">
-                        <div class="w-16 h-16 bg-white border border-slate-200 rounded-2xl flex items-center justify-center mx-auto mb-6 shadow-sm">
-                             <i class="ph-duotone ph-check-circle text-4xl text-emerald-500"></i>
-                        </div>
-                        <h2 class="text-xl font-bold text-slate-900 mb-2">Spot #00${cardId} Available</h2>
-                        <p class="text-slate-500 text-sm mb-8 leading-relaxed">This unit is currently unoccupied and ready for assignment.</p>
-                        
-                        <a href="/" class="text-indigo-600 font-bold hover:text-indigo-800 transition-colors text-xs uppercase tracking-wide">Staff Access</a>
-                    </div>
-                `;
-            } else {
-                container.innerHTML = `
-                    <div class="fade-in max-w-md mx-auto mt-6 px-4">
-                        <div class="card-tech p-8 border-t-4 border-t-slate-900 text-center">
-                            <div class="inline-flex items-center gap-2 px-3 py-1 bg-red-50 border border-red-100 rounded-full text-red-700 text-xs font-bold uppercase tracking-wide mb-8">
-                                <span class="w-1.5 h-1.5 rounded-full bg-red-600 animate-pulse"></span> Occupied
-                            </div>
-
-                            <div class="mb-8">
-                                <p class="text-xs font-bold text-slate-400 uppercase tracking-widest mb-1">Registered Vehicle</p>
-                                <h1 class="text-3xl font-mono font-bold text-slate-900 tracking-tight">${card.vehicle}</h1>
-                            </div>
-
-                            <a href="tel:${card.phone}" class="w-full bg-slate-900 hover:bg-black text-white font-bold py-3.5 rounded-lg shadow-sm transition-all flex items-center justify-center gap-2">
-                                 <i class="ph-bold ph-phone"></i>
-                                 Contact Owner
-                            </a>
-                        </div>
-                        
-                        <button onclick="navigateHome()" class="mt-8 text-slate-400 text-xs font-bold hover:text-slate-600 uppercase tracking-wider">Return to Console</button>
-                    </div>
-                `;
-            }
-        }
-
-        function renderLoader() {
-            return `
-                <div class="flex flex-col items-center justify-center mt-32 text-slate-400 space-y-4">
-                    <i class="ph-bold ph-spinner animate-spin text-2xl text-indigo-600"></i>
-                    <p class="text-xs font-bold tracking-widest uppercase">Connecting...</p>
-                </div>
-            `;
-        }
-
-        window.onload = init;
-    </script>
-</body>
-</html>
-"""
-
-@app.route('/')
-def index():
-    return render_template_string(HTML_TEMPLATE)
-
-@app.route('/api/status', methods=['GET'])
-def get_status():
-    return jsonify(cards_data)
-
-@app.route('/api/update', methods=['POST'])
-def update_status():
-    data = request.json
-    card_id = str(data.get('cardId'))
-    action = data.get('action')
-    
-    if card_id in cards_data:
-        if action == 'checkin':
-            cards_data[card_id]['status'] = 'occupied'
-            cards_data[card_id]['vehicle'] = data.get('vehicle', 'Unknown')
-            cards_data[card_id]['phone'] = data.get('phone', '')
-            cards_data[card_id]['entryTime'] = datetime.now().isoformat()
-        
-        elif action == 'checkout':
-            cards_data[card_id]['status'] = 'empty'
-            cards_data[card_id]['vehicle'] = 'None'
-            cards_data[card_id]['entryTime'] = None
-            
-    return jsonify({"message": "Success", "data": cards_data[card_id]})
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask_cors import CORS
+from datetime import datetime
+import hashlib
+from store import UpdateRejected, create_store
+from allocator import Allocator
+from plates import PlateIndex
+from encoding import EncodedCache, compress, encoded_response, matching_etag, not_modified_response
+from sessions import SessionLog
+from overstay import DEFAULT_MAX_STAY, MINUTE, OverstayMonitor
+from queries import StatusIndex, decode_cursor, encode_cursor
+from reservations import MAX_RESERVATION, ReservationIndex, conflicts, release, reservation_times, reserve
+from spots import now_micros, parse_time
+from analytics import DWELL_BINS, report as analytics_report
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics
+from transfer import CONTENT_TYPES, FORMATS, detect_format, export_sessions, export_spots, import_spots
+import click
+import io
+import json
+import math
+import os
+import time
+
+app = Flask(__name__)
+CORS(app)
+
+# Demo spots, seeded into the store only with SMARTPARK_DEMO=1; provision
+# a real lot with `flask --app app import-spots lot.csv` or POST /api/import
+# Keyed by ID as strings to match frontend expectation
+cards_data = {
+    "1": {"id": 1, "status": "empty", "vehicle": "None", "entryTime": None},
+    "2": {"id": 2, "status": "occupied", "vehicle": "KA-53-Z-9021", "entryTime": datetime.now().isoformat()},
+    "3": {"id": 3, "status": "empty", "vehicle": "None", "entryTime": None}
+}
+
+# The facility (lot) this process serves; router.py sends each facility's
+# requests to its own shard process
+FACILITY = os.environ.get('SMARTPARK_FACILITY', 'main')
+
+LONG_POLL_MAX = 30
+STREAM_KEEPALIVE = 15
+# /api/stream and long-polls hold their worker for as long as they are open,
+# so they are only served where that is cheap: under asgi.py, or a threaded
+# WSGI server (gunicorn -k gthread --threads 100, the Flask dev server).
+# Under gunicorn's default sync workers each dashboard would tie up a whole
+# worker; there /api/stream answers 204, /api/status ignores ?wait=, and
+# /api/facility tells the dashboard to poll instead. SMARTPARK_STREAMING=1
+# or 0 overrides the detection, e.g. =1 for gevent or eventlet workers.
+STREAMING = os.environ.get('SMARTPARK_STREAMING')
+BATCH_MAX = 1000
+
+# Every write bumps the store's version and records the changed spot, so
+# pollers can fetch only what changed since their last version. Set
+# SMARTPARK_STORE=sqlite:///path/to/smartpark.db to share state between
+# gunicorn workers, or SMARTPARK_JOURNAL=/path/to/dir to keep the in-memory
+# store across restarts (single process only).
+journal_dir = os.environ.get('SMARTPARK_JOURNAL')
+seed = cards_data if os.environ.get('SMARTPARK_DEMO') == '1' else {}
+store = create_store(os.environ.get('SMARTPARK_STORE'), seed, journal_dir=journal_dir)
+
+# Free/occupied sets and counts per zone and spot type, for O(log n) spot
+# assignment at the gates.
+allocator = Allocator()
+
+# Parked vehicles by plate for front-desk lookups
+plate_index = PlateIndex()
+
+# Overstay deadlines for /api/overstays; SMARTPARK_MAX_STAY is the allowed
+# stay in minutes for spots without their own maxStay
+overstays = OverstayMonitor(float(os.environ.get('SMARTPARK_MAX_STAY', DEFAULT_MAX_STAY)))
+
+# Spots by zone and status, and by entry time, for filtered /api/status pages
+status_index = StatusIndex()
+
+# Reservations of every spot by start time, for /api/availability
+reservation_index = ReservationIndex()
+
+# Completed sessions for /api/analytics, kept beside the journal when the
+# store has one; the SQLite store records them in its own table
+session_log = SessionLog(os.path.join(journal_dir, 'sessions') if journal_dir else None,
+                         source=store if hasattr(store, 'sessions_since') else None)
+
+# Indexes are loaded from a single pass over the lot
+store.add_index(allocator, plate_index, overstays, status_index, reservation_index, session_log)
+
+# Per-route request counts, latency and response sizes for /metrics
+metrics = Metrics()
+
+@app.before_request
+def start_timer():
+    request.environ['smartpark.started'] = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = request.environ.get('smartpark.started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        size = None if response.is_streamed else response.content_length
+        metrics.observe(route, request.method, response.status_code, time.perf_counter() - started, size)
+    return response
+
+def store_gauges():
+    with store.lock:
+        store.refresh()
+        occupancy = allocator.occupancy()
+        version = store.version
+    spots = [({"zone": zone, "type": spot_type, "state": state}, counts[state])
+             for zone, types in occupancy['zones'].items()
+             for spot_type, counts in types.items()
+             for state in ('free', 'occupied')]
+    return [("smartpark_spots", "Spots by zone, type and state.", spots),
+            ("smartpark_spots_total", "Spots in the lot.", [({}, occupancy['total'])]),
+            ("smartpark_state_version", "Current state version of the store.", [({}, version)])]
+
+metrics.add_gauges(store_gauges)
+
+# The dashboard page has no per-request variables, so it is read and
+# compressed once at startup.
+PAGE_MAX_AGE = 3600
+with open(os.path.join(app.root_path, 'templates', 'index.html'), 'rb') as f:
+    page_body = f.read()
+page_etag = hashlib.sha256(page_body).hexdigest()[:32]
+page_variants = compress(page_body)
+
+# Full snapshots are encoded (and compressed) once per state version and
+# rebuilt lazily on the first read after a write.
+status_cache = EncodedCache()
+resync_cache = EncodedCache()
+
+def dump(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def full_status(cache, version, wrap):
+    # Must be called with store.lock held. Returns cached variants, or the
+    # freshly encoded body to compress outside the lock.
+    variants = cache.get(version)
+    if variants is not None:
+        return variants, None
+    cards = dump(store.as_dict())
+    if wrap:
+        return None, b'{"version":%d,"full":true,"cards":%s}' % (version, cards)
+    return None, cards
+
+@app.route('/')
+def index():
+    held = matching_etag(page_etag, request.if_none_match.contains)
+    if held:
+        response = not_modified_response(app.response_class, held)
+    else:
+        response = encoded_response(app.response_class, page_variants, request.accept_encodings, 'text/html',
+                                    etag=page_etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    return response
+
+def read_status(since, not_modified):
+    # Shared by the Flask views and the ASGI server (asgi.py). Returns
+    # (version, variants): variants is None when the client holds a variant
+    # of the current version, by matching_etag(f"v{version}", not_modified),
+    # otherwise encoded bodies by content coding.
+    variants = body = None
+    with store.lock:
+        store.refresh()
+        version = store.version
+        if matching_etag(f"v{version}", not_modified):
+            return version, None
+        changed = store.changes_since(since) if since is not None else None
+        if changed is not None:
+            return version, {"identity": dump({"version": version, "full": False, "cards": changed})}
+        cache = status_cache if since is None else resync_cache
+        variants, body = full_status(cache, version, wrap=since is not None)
+    if body is not None:
+        variants = cache.put(version, body)
+    return version, variants
+
+def can_hold_connections():
+    if STREAMING in ('0', '1'):
+        return STREAMING == '1'
+    return bool(request.environ.get('wsgi.multithread'))
+
+def stream_message(version):
+    # Returns (version, message): the next Server-Sent Event for a client at
+    # `version`, or None if nothing has changed.
+    variants = body = None
+    with store.lock:
+        if store.version == version:
+            return version, None
+        changed = store.changes_since(version)
+        version = store.version
+        if changed is None:
+            variants, body = full_status(resync_cache, version, wrap=True)
+        else:
+            body = dump({"version": version, "full": False, "cards": changed})
+    if variants is None and changed is None:
+        variants = resync_cache.put(version, body)
+    if variants is not None:
+        body = variants['identity']
+    return version, b"id: %d\ndata: %s\n\n" % (version, body)
+
+# Any of these turns /api/status into a filtered, paginated view
+QUERY_PARAMS = ('status', 'zone', 'enteredAfter', 'enteredBefore', 'minMinutes', 'limit', 'cursor')
+QUERY_LIMIT = 1000
+
+def query_status(args):
+    # ?status=occupied&zone=B&minMinutes=240&limit=100&cursor=...
+    status, zone = args.get('status'), args.get('zone')
+    if status not in (None, 'empty', 'occupied'):
+        return jsonify({"error": "status must be empty or occupied"}), 400
+    try:
+        entered_after = parse_time(args.get('enteredAfter'))
+        entered_before = parse_time(args.get('enteredBefore'))
+        if 'minMinutes' in args:
+            # Occupied at least this long: entered before now - minMinutes
+            min_minutes = float(args['minMinutes'])
+            if not math.isfinite(min_minutes):
+                raise ValueError("minMinutes must be a finite number")
+            cutoff = now_micros() - int(min_minutes * MINUTE)
+            entered_before = cutoff if entered_before is None else min(entered_before, cutoff)
+        limit = int(args.get('limit', 100))
+        if not 0 < limit <= QUERY_LIMIT:
+            raise ValueError(f"limit must be between 1 and {QUERY_LIMIT}")
+        cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+        with store.lock:
+            store.refresh()
+            card_ids, next_cursor, total = status_index.page(status, zone, entered_after, entered_before, cursor, limit)
+            cards = {card_id: store.cards[card_id] for card_id in card_ids}
+            version = store.version
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # A JSON object would lose the page order in clients that sort keys
+    body = {"version": version, "total": total, "order": card_ids, "cards": cards,
+            "nextCursor": encode_cursor(next_cursor) if next_cursor is not None else None}
+    response = app.response_class(dump(body), mimetype='application/json')
+    response.headers['X-State-Version'] = str(version)
+    return response
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    if any(name in request.args for name in QUERY_PARAMS):
+        return query_status(request.args)
+    since = request.args.get('since', type=int)
+    wait = request.args.get('wait', type=float)
+    if since is not None and wait and can_hold_connections():
+        # Long-poll fallback for clients without EventSource
+        with store.lock:
+            store.wait_for_change(since, min(wait, LONG_POLL_MAX))
+
+    version, variants = read_status(since, request.if_none_match.contains)
+    if variants is None:
+        response = not_modified_response(app.response_class,
+                                          matching_etag(f"v{version}", request.if_none_match.contains))
+    else:
+        response = encoded_response(app.response_class, variants, request.accept_encodings, 'application/json',
+                                    etag=f"v{version}")
+    response.headers['X-State-Version'] = str(version)
+    return response
+
+@app.route('/api/stream', methods=['GET'])
+def stream_status():
+    # Server-Sent Events: one message per batch of changes, keepalive comments
+    # while idle. EventSource resends the last id on reconnect.
+    if not can_hold_connections():
+        # EventSource gives up without reconnecting on a 204
+        return Response(status=204)
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', -1, type=int)
+
+    def events(version):
+        while True:
+            with store.lock:
+                store.wait_for_change(version, STREAM_KEEPALIVE)
+            version, message = stream_message(version)
+            yield message or b": keepalive\n\n"
+
+    return Response(stream_with_context(events(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def expected_stay(card, now):
+    # [now, end) the car is expected to stay for, by the spot's allowed stay
+    return now, now + int((overstays.stay(card) or overstays.max_stay) * MINUTE)
+
+def checkin(card, vehicle, phone):
+    if card['status'] == 'occupied':
+        # A retried checkin must not reset entryTime
+        if card.get('vehicle') == vehicle:
+            return None
+        raise UpdateRejected("Spot is already occupied")
+    start, end = expected_stay(card, now_micros())
+    clash = conflicts(card, start, end, vehicle)
+    if clash:
+        raise UpdateRejected(f"Spot is reserved from {clash[0]['from']} to {clash[0]['to']}")
+    # Whatever still overlaps is held by this vehicle; arriving uses it up
+    own = conflicts(card, start, end)
+    if own:
+        card['reservations'] = [reservation for reservation in card['reservations'] if reservation not in own]
+    card['status'] = 'occupied'
+    card['vehicle'] = vehicle
+    card['phone'] = phone
+    card['entryTime'] = datetime.now().isoformat()
+    return card
+
+def checkout(card):
+    if card['status'] == 'empty':
+        return None
+    card['status'] = 'empty'
+    card['vehicle'] = 'None'
+    card['entryTime'] = None
+    return card
+
+def prepare_update(data):
+    # Shared validation for /api/update and /api/update/batch. Returns
+    # (card_id, apply) for store.update, or raises ValueError.
+    if not isinstance(data, dict) or data.get('cardId') is None:
+        raise ValueError("cardId is required")
+    card_id = str(data.get('cardId'))
+    action = data.get('action')
+    expected = data.get('expectedVersion')
+    if expected is not None and type(expected) is not int:
+        raise ValueError("expectedVersion must be an integer")
+
+    if action == 'checkin':
+        vehicle, phone = data.get('vehicle', 'Unknown'), data.get('phone', '')
+        change = lambda card: checkin(card, vehicle, phone)
+
+    elif action == 'checkout':
+        change = checkout
+
+    else:
+        raise ValueError(f"Unknown action: {action}")
+
+    def apply(card):
+        # Compare-and-set against the spot version the client last saw
+        if expected is not None and card.get('version', 0) != expected:
+            raise UpdateRejected(f"Version conflict: spot is at version {card.get('version', 0)}")
+        return change(card)
+
+    return card_id, apply
+
+def apply_update(data, key):
+    # Returns (body, status) for one update; shared with the ASGI server.
+    try:
+        card_id, apply = prepare_update(data)
+        card = store.update(card_id, apply, key=key)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except UpdateRejected as e:
+        return {"error": str(e)}, 409
+    if card is None:
+        return {"error": f"Unknown card: {card_id}"}, 404
+    return {"message": "Success", "data": card}, 200
+
+@app.route('/api/update', methods=['POST'])
+def update_status():
+    body, status = apply_update(request.get_json(silent=True), request.headers.get('Idempotency-Key'))
+    return jsonify(body), status
+
+@app.route('/api/update/batch', methods=['POST'])
+def update_batch():
+    # {"updates": [{"cardId", "action", ...}, ...], "atomic": false}; an
+    # Idempotency-Key header covers the whole batch.
+    data = request.get_json(silent=True) or {}
+    items = data.get('updates')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "updates must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX:
+        return jsonify({"error": f"At most {BATCH_MAX} updates per batch"}), 400
+    atomic = bool(data.get('atomic'))
+
+    results = [None] * len(items)
+    updates, positions = [], []
+    for i, item in enumerate(items):
+        try:
+            updates.append(prepare_update(item))
+            positions.append(i)
+        except ValueError as e:
+            results[i] = {"ok": False, "status": 400, "error": str(e)}
+    if atomic and len(updates) < len(items):
+        outcomes, applied = [UpdateRejected("Batch not applied")] * len(updates), False
+    else:
+        outcomes, applied = store.update_many(updates, atomic=atomic, key=request.headers.get('Idempotency-Key'))
+    for i, (card_id, _), outcome in zip(positions, updates, outcomes):
+        if outcome is None:
+            results[i] = {"ok": False, "status": 404, "error": f"Unknown card: {card_id}"}
+        elif isinstance(outcome, UpdateRejected):
+            results[i] = {"ok": False, "status": 409, "error": str(outcome)}
+        elif applied:
+            results[i] = {"ok": True, "data": outcome}
+        else:
+            results[i] = {"ok": False, "status": 409, "error": "Batch not applied"}
+
+    body = {"message": "Success" if applied else "Batch not applied", "applied": applied, "results": results}
+    return jsonify(body), 200 if applied else 409
+
+@app.route('/api/allocate', methods=['POST'])
+def allocate_spot():
+    data = request.json or {}
+    rejected = set()
+    while True:
+        with store.lock:
+            store.refresh()
+            # Skip spots reserved for someone else during a default stay
+            start, end = expected_stay({}, now_micros())
+            card_id = allocator.pick(data.get('zone'), data.get('type'),
+                                     reservation_index.reserved(start, end) | rejected)
+        if card_id is None:
+            return jsonify({"error": "No free spot available"}), 409
+
+        taken = []
+        def apply(card):
+            # Another gate may have taken the spot since we picked it
+            if card['status'] != 'empty':
+                return None
+            taken.append(card_id)
+            return checkin(card, data.get('vehicle', 'Unknown'), data.get('phone', ''))
+
+        try:
+            card = store.update(card_id, apply)
+        except UpdateRejected:
+            # Reserved within this spot's own (longer) allowed stay
+            rejected.add(card_id)
+            continue
+        if taken:
+            return jsonify({"message": "Success", "cardId": card_id, "data": card})
+
+def parse_window(args):
+    # (start, end) from ?from=&to=, or raises ValueError
+    start, end = parse_time(args.get('from')), parse_time(args.get('to'))
+    if start is None or end is None:
+        raise ValueError("from and to are required")
+    if end <= start:
+        raise ValueError("to must be after from")
+    return start, end
+
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    # {"cardId", "from", "to", "vehicle", "phone"}; times are local ISO
+    data = request.get_json(silent=True) or {}
+    try:
+        start, end = parse_window(data)
+        if data.get('cardId') is None:
+            raise ValueError("cardId is required")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if end <= now_micros():
+        return jsonify({"error": "Reservation is already over"}), 400
+    if end - start > MAX_RESERVATION:
+        return jsonify({"error": "Reservation is too long"}), 400
+    card_id = str(data['cardId'])
+
+    made = []
+    def apply(card):
+        try:
+            made.append(reserve(card, start, end, data.get('vehicle', 'Unknown'), data.get('phone', '')))
+        except ValueError as e:
+            raise UpdateRejected(str(e))
+        return card
+
+    try:
+        card = store.update(card_id, apply, key=request.headers.get('Idempotency-Key'))
+    except UpdateRejected as e:
+        return jsonify({"error": str(e)}), 409
+    if card is None:
+        return jsonify({"error": f"Unknown card: {card_id}"}), 404
+    # A replayed request returns the reservation the first one made
+    reservation = made[0] if made else next(
+        (item for item in card.get('reservations', ()) if reservation_times(item) == (start, end)), None)
+    return jsonify({"message": "Success", "cardId": card_id, "reservation": reservation, "data": card}), 201
+
+@app.route('/api/reservations/<reservation_id>', methods=['DELETE'])
+def cancel_reservation(reservation_id):
+    with store.lock:
+        store.refresh()
+        card_id = reservation_index.spot_of(reservation_id)
+    if card_id is None:
+        return jsonify({"error": f"Unknown reservation: {reservation_id}"}), 404
+    card = store.update(card_id, lambda card: card if release(card, reservation_id) else None)
+    return jsonify({"message": "Success", "cardId": card_id, "data": card})
+
+@app.route('/api/availability', methods=['GET'])
+def get_availability():
+    # Spots free for the whole of ?from=&to=. A window that has already
+    # begun also excludes spots that are occupied now.
+    try:
+        start, end = parse_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+
+    with store.lock:
+        store.refresh()
+        reserved = reservation_index.reserved(start, end)
+        if start <= now_micros():
+            candidates = allocator.free_spots()
+            free = allocator.occupancy()['free'] - sum(1 for card_id in reserved if allocator.is_free(card_id))
+        else:
+            candidates = iter(store.cards)
+            free = len(store.cards) - len(reserved)
+        spots = []
+        for card_id in candidates:
+            if len(spots) == limit:
+                break
+            if card_id not in reserved:
+                spots.append(card_id)
+    return jsonify({"from": request.args['from'], "to": request.args['to'], "free": free, "spots": spots})
+
+@app.route('/api/facility', methods=['GET'])
+def get_facility():
+    with store.lock:
+        store.refresh()
+        return jsonify({"id": FACILITY, "spots": len(store.cards), "version": store.version,
+                        "streaming": can_hold_connections()})
+
+@app.route('/api/occupancy', methods=['GET'])
+def get_occupancy():
+    with store.lock:
+        store.refresh()
+        return jsonify(allocator.occupancy())
+
+@app.route('/api/search', methods=['GET'])
+def search_plate():
+    plate = request.args.get('plate', '')
+    match = request.args.get('match', 'partial')
+    if match not in ('exact', 'prefix', 'partial'):
+        return jsonify({"error": "match must be exact, prefix or partial"}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+
+    with store.lock:
+        store.refresh()
+        results = [{"plate": found, "cardId": card_id, "data": store.cards[card_id]}
+                   for found, card_ids in plate_index.search(plate, match, limit)
+                   for card_id in card_ids]
+    return jsonify({"query": plate, "results": results})
+
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    # ?from=2024-05-01&to=2024-06-01 (ISO dates or times, local), optional
+    # ?bins=0,30,60,240 for the dwell histogram in minutes
+    try:
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        bins = request.args.get('bins')
+        bins = sorted({int(edge) for edge in bins.split(',')}) if bins else DWELL_BINS
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if start is not None and end is not None and end <= start:
+        return jsonify({"error": "to must be after from"}), 400
+
+    with store.lock:
+        store.refresh()
+        columns, keys = session_log.snapshot()
+        spots = len(store.cards)
+    try:
+        return jsonify(analytics_report(columns, keys, start, end, spots, bins))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/overstays', methods=['GET'])
+def get_overstays():
+    # ?since=<lastEventId> returns only later events; ids are the same on
+    # every worker and across restarts
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    try:
+        return jsonify(overstays.report(request.args.get('since'), limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/import', methods=['POST'])
+def import_upload():
+    # CSV or NDJSON body, by ?format= or Content-Type; read and written in
+    # chunks as it arrives
+    fmt = detect_format(request.args.get('format'), request.content_type)
+    if fmt is None:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8-sig', newline='')
+    try:
+        summary = import_spots(store, lines, fmt)
+    except UnicodeDecodeError:
+        return jsonify({"error": "body must be UTF-8"}), 400
+    return jsonify(summary)
+
+def export_response(chunks, fmt, name):
+    return Response(stream_with_context(chunk.encode() for chunk in chunks), mimetype=CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{FACILITY}-{name}.{fmt}"'})
+
+@app.route('/api/export/spots', methods=['GET'])
+def export_spots_download():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    return export_response(export_spots(store, status_index, fmt), fmt, 'spots')
+
+def session_chunks(fmt, start, end):
+    with store.lock:
+        store.refresh()
+        columns, keys = session_log.snapshot()
+    return export_sessions(columns, keys, fmt, start, end)
+
+@app.route('/api/export/sessions', methods=['GET'])
+def export_sessions_download():
+    # Sessions that ended in [from, to), both optional
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    try:
+        start, end = parse_time(request.args.get('from')), parse_time(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return export_response(session_chunks(fmt, start, end), fmt, 'sessions')
+
+# flask --app app import-spots lot.csv; run against the SQLite store, or
+# with the server stopped when the store is journaled in memory. Refused for
+# a plain memory store, which would be thrown away on exit
+@app.cli.command('import-spots')
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="Defaults to the file extension.")
+def import_spots_command(path, fmt):
+    """Create or update spots from a CSV or NDJSON file."""
+    if not store.durable:
+        raise click.UsageError("the store is in memory only; set SMARTPARK_STORE=sqlite:///... or SMARTPARK_JOURNAL")
+    fmt = detect_format(fmt or path)
+    if fmt is None:
+        raise click.UsageError("cannot tell the format from the file name; pass --format")
+    with click.open_file(path, encoding='utf-8-sig') as lines:
+        summary = import_spots(store, lines, fmt)
+    for error in summary['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"{summary['created']} created, {summary['updated']} updated, {summary['rejected']} rejected")
+
+@app.cli.command('export-spots')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+@click.option('--output', '-o', type=click.Path(allow_dash=True), default='-')
+def export_spots_command(fmt, output):
+    """Write the current state of every spot."""
+    with click.open_file(output, 'w', encoding='utf-8') as f:
+        f.writelines(export_spots(store, status_index, fmt))
+
+@app.cli.command('export-sessions')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+@click.option('--output', '-o', type=click.Path(allow_dash=True), default='-')
+@click.option('--from', 'start', help="Only sessions that ended at or after this ISO time.")
+@click.option('--to', 'end', help="Only sessions that ended before this ISO time.")
+def export_sessions_command(fmt, output, start, end):
+    """Write the completed session history."""
+    try:
+        start, end = parse_time(start), parse_time(end)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    with click.open_file(output, 'w', encoding='utf-8') as f:
+        f.writelines(session_chunks(fmt, start, end))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
@@ -0,0 +1,364 @@
+"""Asyncio (ASGI) serving mode.
+
+    uvicorn asgi:app --port 5000 --limit-concurrency 20000
+
+The dashboard routes (/, /api/status, /api/stream and /api/update) are
+served on the event loop. A client waiting on a long-poll or a stream is a
+coroutine parked on a shared future that the store resolves after each
+write, so an idle connection costs a few kilobytes instead of a worker
+thread. Store calls that take the lock or encode a snapshot run in the
+default thread pool. Every other route is handed to the Flask app (app.py)
+in a pool of its own (SMARTPARK_FALLBACK_THREADS threads), so slow imports
+and exports cannot starve the dashboard routes, and `python app.py` and
+gunicorn keep working unchanged.
+Request and response bodies stream between the two, so imports and
+exports are never buffered whole.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_accept_header, parse_etags
+
+import app as smartpark
+from encoding import choose_variant, matching_etag, variant_etag
+
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+# Threads for routes handed to the Flask app; further requests queue for one
+FALLBACK_THREADS = int(os.environ.get("SMARTPARK_FALLBACK_THREADS", 16))
+fallback_pool = ThreadPoolExecutor(FALLBACK_THREADS, thread_name_prefix="smartpark-wsgi")
+
+
+class ChangeNotifier:
+    """Wakes every waiting coroutine when the store changes. notify() is
+    registered as a store watcher and may be called from any thread."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self._scheduled = False
+
+    def notify(self):
+        # Writes arriving before the loop runs _fire share one wake-up
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        self._scheduled = False
+        future, self.future = self.future, self.loop.create_future()
+        future.set_result(None)
+
+    async def wait(self, version, timeout):
+        # Returns once the store has moved past `version` or after `timeout`.
+        deadline = self.loop.time() + timeout
+        while True:
+            future = self.future
+            if smartpark.store.version != version:
+                return
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return
+            await asyncio.wait({future}, timeout=remaining)
+
+
+class StreamMessages:
+    """Most stream clients sit at the same version, so each SSE message is
+    built once per (from, to) pair and shared between them."""
+
+    def __init__(self):
+        self._version = None
+        self._messages = {}
+
+    async def next(self, version):
+        current = smartpark.store.version
+        if current == self._version and version in self._messages:
+            return current, self._messages[version]
+        new_version, message = await run(smartpark.stream_message, version)
+        if message is not None:
+            if new_version != self._version:
+                self._version, self._messages = new_version, {}
+            self._messages[version] = message
+        return new_version, message
+
+
+notifier = None
+messages = StreamMessages()
+
+
+def get_notifier():
+    global notifier
+    if notifier is None:
+        notifier = ChangeNotifier(asyncio.get_running_loop())
+        smartpark.store.watchers.append(notifier.notify)
+    return notifier
+
+
+def run(func, *args):
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class Request:
+    def __init__(self, scope):
+        self.started = time.perf_counter()
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+
+    def arg(self, name, type, default=None):
+        try:
+            return type(self.query[name][0])
+        except (KeyError, ValueError):
+            return default
+
+    def header(self, name, type=str, default=None):
+        try:
+            return type(self.headers[name])
+        except (KeyError, ValueError):
+            return default
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def respond(send, status, body=b"", headers=()):
+    headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers + CORS_HEADERS})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def respond_encoded(send, request, variants, mimetype, headers, etag):
+    coding, body = choose_variant(variants, parse_accept_header(request.header("accept-encoding")))
+    headers = headers + [("ETag", f'"{variant_etag(etag, coding)}"'), ("Content-Type", mimetype),
+                         ("Vary", "Accept-Encoding")]
+    if coding:
+        headers.append(("Content-Encoding", coding))
+    await respond(send, 200, body, headers)
+
+
+async def respond_not_modified(send, etag, headers):
+    await respond(send, 304, headers=headers + [("ETag", f'"{etag}"'), ("Vary", "Accept-Encoding")])
+
+
+async def index(request, receive, send):
+    headers = [("Cache-Control", f"public, max-age={smartpark.PAGE_MAX_AGE}")]
+    held = matching_etag(smartpark.page_etag, parse_etags(request.header("if-none-match")).contains)
+    if held:
+        await respond_not_modified(send, held, headers)
+    else:
+        await respond_encoded(send, request, smartpark.page_variants, "text/html; charset=utf-8", headers,
+                              smartpark.page_etag)
+
+
+async def get_status(request, receive, send):
+    since = request.arg("since", int)
+    wait = request.arg("wait", float)
+    if since is not None and wait:
+        await get_notifier().wait(since, min(wait, smartpark.LONG_POLL_MAX))
+
+    held = parse_etags(request.header("if-none-match")).contains
+    version, variants = await run(smartpark.read_status, since, held)
+    headers = [("X-State-Version", str(version))]
+    if variants is None:
+        await respond_not_modified(send, matching_etag(f"v{version}", held), headers)
+    else:
+        await respond_encoded(send, request, variants, "application/json", headers, f"v{version}")
+
+
+async def stream_status(request, receive, send):
+    since = request.header("last-event-id", int)
+    if since is None:
+        since = request.arg("since", int, -1)
+
+    async def events(version):
+        while True:
+            await get_notifier().wait(version, smartpark.STREAM_KEEPALIVE)
+            version, message = await messages.next(version)
+            await send({"type": "http.response.body", "body": message or b": keepalive\n\n", "more_body": True})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no")] + CORS_HEADERS})
+    tasks = {asyncio.ensure_future(events(since)), asyncio.ensure_future(disconnected())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        task.result()
+
+
+async def update_status(request, receive, send):
+    try:
+        data = json.loads(await read_body(receive))
+    except ValueError:
+        data = None
+    body, status = await run(smartpark.apply_update, data, request.header("idempotency-key"))
+    await respond(send, status, smartpark.dump(body), [("Content-Type", "application/json")])
+
+
+ROUTES = {
+    ("GET", "/"): index,
+    ("GET", "/api/status"): get_status,
+    ("GET", "/api/stream"): stream_status,
+    ("POST", "/api/update"): update_status,
+}
+
+
+class BodyStream(io.RawIOBase):
+    """wsgi.input for the Flask app: reads the request body from the ASGI
+    receive channel as the app consumes it, so uploads are never held in
+    memory whole. Used from a fallback_pool thread."""
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = b""
+        self.done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and not self.done:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message["type"] == "http.disconnect":
+                self.done = True
+                break
+            self.pending = message.get("body", b"")
+            self.done = not message.get("more_body")
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BufferedReader(body),
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def call_wsgi(environ, send, loop):
+    # Runs the Flask app in a fallback_pool thread, sending each chunk of the
+    # response as it is produced. A chunk is held back until the next one
+    # arrives so the last one can close the response.
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        emit({"type": "http.response.start", "status": int(status.split()[0]),
+              "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+        return lambda chunk: emit({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    result = smartpark.app(environ, start_response)
+    try:
+        previous = b""
+        for chunk in result:
+            if chunk:
+                if previous:
+                    emit({"type": "http.response.body", "body": previous, "more_body": True})
+                previous = chunk
+        emit({"type": "http.response.body", "body": previous})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+
+async def fallback(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(fallback_pool, call_wsgi, wsgi_environ(scope, BodyStream(receive, loop)), send, loop)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_notifier()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def observed(request, send):
+    # Records the response in app.metrics: when it completes, or when it
+    # starts for streams sent without a Content-Length.
+    state = {}
+
+    async def send_observed(message):
+        await send(message)
+        if message["type"] == "http.response.start":
+            headers = dict(message["headers"])
+            state["status"] = message["status"]
+            state["size"] = int(headers[b"content-length"]) if b"content-length" in headers else None
+            if state["size"] is None:
+                smartpark.metrics.observe(request.path, request.method, state["status"],
+                                          time.perf_counter() - request.started)
+        elif state.get("size") is not None and not message.get("more_body"):
+            smartpark.metrics.observe(request.path, request.method, state["status"],
+                                      time.perf_counter() - request.started, state["size"])
+
+    return send_observed
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is get_status and any(f"{name}=".encode() in scope.get("query_string", b"")
+                                     for name in smartpark.QUERY_PARAMS):
+        handler = None  # filtered views are served by the Flask app
+    if handler is None:
+        return await fallback(scope, receive, send)
+    request = Request(scope)
+    await handler(request, receive, observed(request, send))
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000, limit_concurrency=20000)
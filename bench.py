@@ -0,0 +1,362 @@
+"""Benchmarks for the status and update hot paths.
+
+    python bench.py                                  # 1k, 10k and 100k spots
+    python bench.py --spots 10000 --targets gunicorn --workers 8
+    python bench.py --baseline bench-1.4.json        # fail on regressions
+
+For each lot size a seeded copy of the store is served by each target and
+driven with a mixed workload for --duration seconds:
+
+    status      GET /api/status, the full snapshot
+    delta       GET /api/status?since=<last version>, changes only
+    revalidate  GET /api/status with If-None-Match (304 when unchanged)
+    update      POST /api/update, alternating checkin/checkout per spot
+
+Targets:
+
+    testclient  the Flask test client in a fresh process (in-memory store
+                seeded from a snapshot, so writes are journaled)
+    gunicorn    a locally launched multi-worker gunicorn sharing a seeded
+                SQLite store, driven over HTTP by --concurrency threads
+
+Throughput, p50/p99 latency and mean response bytes are reported per
+operation and written to --out as JSON for comparing releases.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from snapshot import write_snapshot
+from store import SQLiteStore
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ("status", "delta", "revalidate", "update")
+DEFAULT_MIX = "status=1,delta=5,revalidate=3,update=1"
+OCCUPIED_EVERY = 3
+
+
+def seed_cards(count):
+    # Spot ids "1".."count" (a superset of app.cards_data); every third
+    # spot starts occupied so snapshots carry realistic payloads.
+    cards = {}
+    for number in range(1, count + 1):
+        if number % OCCUPIED_EVERY == 0:
+            cards[str(number)] = {"id": number, "status": "occupied", "vehicle": f"KA-{number:06d}",
+                                  "entryTime": "2024-01-01T08:00:00", "phone": ""}
+        else:
+            cards[str(number)] = {"id": number, "status": "empty", "vehicle": "None", "entryTime": None}
+    return cards
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation in mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Workload:
+    """Picks operations by weight and keeps the client-side view (last
+    version and ETag, which spots are occupied) for one driver thread."""
+
+    def __init__(self, mix, owned, seed):
+        self.random = random.Random(seed)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.owned = owned
+        self.occupied = {number: number % OCCUPIED_EVERY == 0 for number in owned}
+        self.version = 0
+        self.etag = None
+        self.samples = {name: [] for name in OPERATIONS}
+        self.codes = {}
+
+    def next_request(self):
+        # Returns (operation, method, path, headers, body).
+        name = self.random.choices(self.names, self.weights)[0]
+        if name == "status":
+            return name, "GET", "/api/status", {}, None
+        if name == "delta":
+            return name, "GET", f"/api/status?since={self.version}", {}, None
+        if name == "revalidate":
+            return name, "GET", "/api/status", {"If-None-Match": self.etag or '"none"'}, None
+        number = self.random.choice(self.owned)
+        if self.occupied[number]:
+            update = {"cardId": str(number), "action": "checkout"}
+        else:
+            update = {"cardId": str(number), "action": "checkin", "vehicle": f"BN-{number:06d}"}
+        self.occupied[number] = not self.occupied[number]
+        return name, "POST", "/api/update", {"Content-Type": "application/json"}, json.dumps(update).encode()
+
+    def record(self, name, status, headers, size, elapsed):
+        self.samples[name].append((elapsed, size))
+        self.codes[status] = self.codes.get(status, 0) + 1
+        version = headers.get("X-State-Version")
+        if version is not None:
+            self.version = int(version)
+        if headers.get("ETag"):
+            self.etag = headers["ETag"]
+
+
+def summarize(workloads, elapsed):
+    operations = {}
+    every = []
+    codes = {}
+    for workload in workloads:
+        for status, count in workload.codes.items():
+            codes[str(status)] = codes.get(str(status), 0) + count
+    for name in OPERATIONS:
+        samples = [sample for workload in workloads for sample in workload.samples[name]]
+        every.extend(samples)
+        if samples:
+            operations[name] = summarize_samples(samples, elapsed)
+    return {"operations": operations, "total": summarize_samples(every, elapsed), "status_codes": codes}
+
+
+def summarize_samples(samples, elapsed):
+    latencies = sorted(latency for latency, size in samples)
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "bytes_mean": round(sum(size for latency, size in samples) / len(samples), 1),
+    }
+
+
+def run_testclient(args):
+    # Runs inside a child process whose environment points the app at the
+    # seeded journal; see bench_testclient().
+    import app as smartpark
+
+    client = smartpark.app.test_client()
+    spots = len(smartpark.store.cards)
+    workload = Workload(args.mix, list(range(1, spots + 1)), args.seed)
+    deadline = time.perf_counter() + args.warmup
+    while time.perf_counter() < deadline:
+        drive_testclient(client, workload, record=False)
+    workload.samples = {name: [] for name in OPERATIONS}
+    workload.codes = {}
+    started = time.perf_counter()
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        drive_testclient(client, workload)
+    json.dump(summarize([workload], time.perf_counter() - started), sys.stdout)
+
+
+def drive_testclient(client, workload, record=True):
+    name, method, path, headers, body = workload.next_request()
+    started = time.perf_counter()
+    response = client.open(path, method=method, headers=headers, data=body)
+    size = len(response.get_data())
+    elapsed = time.perf_counter() - started
+    if record:
+        workload.record(name, response.status_code, response.headers, size, elapsed)
+
+
+def bench_testclient(args, spots, scratch):
+    journal = os.path.join(scratch, "journal")
+    os.makedirs(journal)
+    write_snapshot(os.path.join(journal, "snapshot.bin"), 0, seed_cards(spots))
+    env = dict(os.environ, SMARTPARK_STORE="memory", SMARTPARK_JOURNAL=journal)
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--mix", args.mix_text,
+               "--duration", str(args.duration), "--warmup", str(args.warmup), "--seed", str(args.seed)]
+    result = subprocess.run(command, env=env, cwd=ROOT, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            conn.request("GET", "/api/status?since=0")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def drive_http(port, workload, stop, recording):
+    while not stop.is_set():
+        name, method, path, headers, body = workload.next_request()
+        started = time.perf_counter()
+        try:
+            # Sync gunicorn workers close the connection after each response
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            size = len(response.read())
+            status, response_headers = response.status, response.headers
+            conn.close()
+        except OSError:
+            status, response_headers, size = "error", {}, 0
+        elapsed = time.perf_counter() - started
+        if recording.is_set():
+            workload.record(name, status, response_headers, size, elapsed)
+
+
+def bench_gunicorn(args, spots, scratch):
+    database = os.path.join(scratch, "smartpark.db")
+    SQLiteStore(database, seed_cards(spots))
+    port = free_port()
+    env = dict(os.environ, SMARTPARK_STORE=f"sqlite:///{database}")
+    env.pop("SMARTPARK_JOURNAL", None)
+    command = [sys.executable, "-m", "gunicorn", "--workers", str(args.workers), "--threads", str(args.threads),
+               "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"]
+    process = subprocess.Popen(command, env=env, cwd=ROOT)
+    try:
+        wait_for_server(port, process)
+        owned = [list(range(first, spots + 1, args.concurrency)) for first in range(1, args.concurrency + 1)]
+        workloads = [Workload(args.mix, owned[i] or [1], args.seed + i) for i in range(args.concurrency)]
+        stop, recording = threading.Event(), threading.Event()
+        threads = [threading.Thread(target=drive_http, args=(port, workload, stop, recording))
+                   for workload in workloads]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        recording.set()
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        recording.clear()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return summarize(workloads, elapsed)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+TARGETS = {"testclient": bench_testclient, "gunicorn": bench_gunicorn}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result):
+    print(f"\n{result['target']}, {result['spots']} spots")
+    print(f"  {'operation':<11} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>10}")
+    for name, stats in list(result["operations"].items()) + [("total", result["total"])]:
+        print(f"  {name:<11} {stats['throughput']:>9} {stats['p50_ms']:>9} {stats['p99_ms']:>9} "
+              f"{stats['bytes_mean']:>10}")
+
+
+def compare(results, baseline_path, tolerance):
+    # Returns regressions against a previous results file: lower throughput
+    # or higher p99 latency by more than `tolerance` (a fraction).
+    with open(baseline_path) as f:
+        baseline = {(result["target"], result["spots"]): result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["target"], result["spots"]))
+        if previous is None:
+            continue
+        for name, stats in result["operations"].items():
+            before = previous["operations"].get(name)
+            if before is None:
+                continue
+            label = f"{result['target']}/{result['spots']}/{name}"
+            if stats["throughput"] < before["throughput"] * (1 - tolerance):
+                regressions.append(f"{label}: throughput {before['throughput']} -> {stats['throughput']} req/s")
+            if stats["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{label}: p99 {before['p99_ms']} -> {stats['p99_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SmartPark status and update routes.")
+    parser.add_argument("--spots", default="1000,10000,100000", help="comma-separated lot sizes")
+    parser.add_argument("--targets", default="testclient,gunicorn", help="comma-separated: testclient, gunicorn")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each run")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads driving gunicorn")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench-results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression (fraction)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.mix_text, args.mix = args.mix, parse_mix(args.mix)
+
+    if args.child:
+        run_testclient(args)
+        return
+
+    targets = [target for target in args.targets.split(",") if target]
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target: {target}")
+    results = []
+    for spots in (int(count) for count in args.spots.split(",")):
+        for target in targets:
+            scratch = tempfile.mkdtemp(prefix="smartpark-bench-")
+            try:
+                result = {"target": target, "spots": spots, **TARGETS[target](args, spots, scratch)}
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+            print_result(result)
+            results.append(result)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"mix": args.mix, "duration": args.duration, "warmup": args.warmup,
+                     "workers": args.workers, "threads": args.threads, "concurrency": args.concurrency},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {args.out}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
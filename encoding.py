@@ -0,0 +1,83 @@
+"""Pre-encoded response bodies with precompressed variants.
+
+Bodies that are served far more often than they change are encoded and
+compressed once, then picked per request from Accept-Encoding.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this size compression costs more than it saves
+MIN_COMPRESS_SIZE = 1024
+# Content codings offered, best first
+CODINGS = ("br", "gzip")
+
+
+def compress(body):
+    variants = {"identity": body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        variants["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=5)
+    return variants
+
+
+def choose_variant(variants, accept_encodings):
+    # Returns (coding, body); coding is None for the identity body.
+    offered = [coding for coding in CODINGS if coding in variants]
+    coding = accept_encodings.best_match(offered) if offered else None
+    return coding, variants[coding or "identity"]
+
+
+def variant_etag(etag, coding):
+    # A strong ETag names one byte sequence, so each coding of a body gets
+    # its own: "<etag>" for identity, "<etag>-gzip", "<etag>-br".
+    return f"{etag}-{coding}" if coding else etag
+
+
+def matching_etag(etag, contains):
+    # The tag of whichever variant of `etag` the client holds, or None;
+    # `contains` tests If-None-Match.
+    for coding in (None,) + CODINGS:
+        if contains(variant_etag(etag, coding)):
+            return variant_etag(etag, coding)
+    return None
+
+
+def encoded_response(response_class, variants, accept_encodings, mimetype, etag=None):
+    coding, body = choose_variant(variants, accept_encodings)
+    response = response_class(body, mimetype=mimetype)
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    if etag is not None:
+        response.set_etag(variant_etag(etag, coding))
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def not_modified_response(response_class, etag):
+    # A 304 for the variant the client already holds (see matching_etag()).
+    response = response_class(status=304)
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+class EncodedCache:
+    """Holds the encoded variants of a single body, tagged with a key such as
+    the state version it was built from."""
+
+    def __init__(self):
+        self._entry = (None, None)
+
+    def get(self, key):
+        cached_key, variants = self._entry
+        return variants if cached_key == key else None
+
+    def put(self, key, body):
+        variants = compress(body)
+        self._entry = (key, variants)
+        return variants
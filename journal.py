@@ -0,0 +1,162 @@
+"""Append-only journal of spot writes for the in-memory store.
+
+Each write is appended as one JSON line carrying the state version and the
+spot as stored. A single committer thread writes and fsyncs whatever has
+queued up since its last fsync (group commit), so concurrent writers share
+one disk flush. Every COMPACT_EVERY entries the store's state is written to
+a binary snapshot (see snapshot.py) and the journal moves on to a new
+segment; segments covered by the snapshot are deleted, which keeps replay
+time bounded. On start-up the snapshot is memory-mapped rather than parsed,
+though loading the store's indexes afterwards still decodes every spot.
+
+Layout of the journal directory:
+
+    snapshot.bin                    spot table as of some version N
+    journal-<first version>.log     one {"v", "id", "card"} line per write
+"""
+import json
+import os
+import threading
+
+from snapshot import MappedSnapshot, MappedSpots, write_snapshot
+from spots import SpotTable
+
+COMPACT_EVERY = 50000
+SNAPSHOT_NAME = "snapshot.bin"
+
+
+class Journal:
+    def __init__(self, directory, compact_every=COMPACT_EVERY):
+        self.directory = directory
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._synced = 0
+        self._since_rotate = 0
+        self._compacting = False
+        self._file = None
+        self._pid = None
+        self._failed = None
+
+    def _segments(self):
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith("journal-") and name.endswith(".log")]
+        return sorted(names, key=lambda name: int(name[len("journal-"):-len(".log")]))
+
+    def _segment_path(self, version):
+        return os.path.join(self.directory, f"journal-{version}.log")
+
+    def recover(self, cards):
+        # Returns (version, cards) rebuilt from the snapshot plus every
+        # journal entry newer than it, starting from `cards` when there is
+        # no snapshot yet.
+        version = 0
+        cards = SpotTable(cards.items())
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            snapshot = MappedSnapshot(snapshot_path)
+            version, cards = snapshot.version, MappedSpots(snapshot)
+
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), "r+b") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write from a crash. Cut it off, or the next
+                        # append to this segment would be glued onto it.
+                        f.truncate(f.tell() - len(line))
+                        break
+                    entry = json.loads(line)
+                    if entry["v"] > version:
+                        cards[entry["id"]] = entry["card"]
+                        version = entry["v"]
+
+        self._file = open(self._segment_path(version + 1), "ab")
+        return version, cards
+
+    def append(self, version, card_id, card):
+        # Called with the store lock held, so entries queue in version order.
+        # Returns a ticket to wait() on for durability.
+        line = json.dumps({"v": version, "id": card_id, "card": card}, separators=(",", ":"))
+        with self._cond:
+            self._start()
+            self._pending.append(line.encode() + b"\n")
+            self._appended += 1
+            self._since_rotate += 1
+            self._cond.notify_all()
+            return self._appended
+
+    def wait(self, ticket):
+        # Raises if the committer thread failed before the entry was synced.
+        with self._cond:
+            self._cond.wait_for(lambda: self._synced >= ticket or self._failed)
+            if self._synced < ticket:
+                raise RuntimeError("Journal commit failed") from self._failed
+
+    def _start(self):
+        # Called with _cond held. The committer thread does not survive a
+        # fork, so it is started by the first append in each process.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._commit_loop, daemon=True).start()
+
+    def _commit_loop(self):
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._pending)
+                    batch, self._pending = self._pending, []
+                    ticket = self._appended
+                for item in batch:
+                    if isinstance(item, bytes):
+                        self._file.write(item)
+                    else:
+                        # Rotation marker: finish the segment, start the next one
+                        self._sync()
+                        self._file.close()
+                        self._file = open(item, "ab")
+                self._sync()
+                with self._cond:
+                    self._synced = ticket
+                    self._cond.notify_all()
+        except Exception as error:
+            # A failed write or fsync (ENOSPC, EIO) leaves nothing durable
+            # past _synced; wake every waiter so it can report the failure.
+            with self._cond:
+                self._failed = error
+                self._cond.notify_all()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def should_compact(self):
+        return self._since_rotate >= self.compact_every and not self._compacting
+
+    def compact(self, version, cards):
+        # Called with the store lock held and a copy of the spot table as of
+        # `version`; the snapshot itself is written in the background.
+        with self._cond:
+            self._start()
+            self._compacting = True
+            self._since_rotate = 0
+            self._pending.append(self._segment_path(version + 1))
+            self._cond.notify_all()
+        threading.Thread(target=self._write_snapshot, args=(version, cards), daemon=True).start()
+
+    def _write_snapshot(self, version, cards):
+        try:
+            write_snapshot(os.path.join(self.directory, SNAPSHOT_NAME), version, cards)
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            # Segments that start at or before `version` only hold entries
+            # the snapshot already covers.
+            for name in self._segments():
+                if int(name[len("journal-"):-len(".log")]) <= version:
+                    os.remove(os.path.join(self.directory, name))
+        finally:
+            self._compacting = False
@@ -0,0 +1,102 @@
+"""Request metrics in the Prometheus text format.
+
+Each request adds one sample per series: a count by route, method and
+status (so 304s can be compared with 200s), a latency histogram and a
+response size histogram by route and method. Each observation takes one lock,
+one bisect per histogram and a few list increments. Rendering happens only
+when /metrics is scraped.
+
+Counts are kept per process. Under several gunicorn workers, each scrape
+reads whichever worker answered it.
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.total}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.sizes = {}
+        self.gauges = []
+
+    def observe(self, route, method, status, seconds, size=None):
+        # size is None for streamed responses, whose length is not known
+        # when they start.
+        with self.lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            key = (route, method)
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            latency.observe(seconds)
+            if size is not None:
+                sizes = self.sizes.get(key)
+                if sizes is None:
+                    sizes = self.sizes[key] = Histogram(SIZE_BUCKETS)
+                sizes.observe(size)
+
+    def add_gauges(self, collect):
+        # collect() returns [(name, help, [(labels dict, value)])], read at
+        # scrape time.
+        self.gauges.append(collect)
+
+    def render(self):
+        with self.lock:
+            requests = sorted(self.requests.items())
+            latency = sorted((key, list(h.counts), h.total, h.count) for key, h in self.latency.items())
+            sizes = sorted((key, list(h.counts), h.total, h.count) for key, h in self.sizes.items())
+        lines = ["# HELP smartpark_http_requests_total HTTP requests by route, method and status.",
+                 "# TYPE smartpark_http_requests_total counter"]
+        for (route, method, status), count in requests:
+            lines.append(f'smartpark_http_requests_total{{route="{label(route)}",method="{method}",'
+                         f'status="{status}"}} {count}')
+        for name, help, buckets, series in (
+                ("smartpark_http_request_duration_seconds", "Time to produce the response.", LATENCY_BUCKETS, latency),
+                ("smartpark_http_response_size_bytes", "Response body size as sent.", SIZE_BUCKETS, sizes)):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for (route, method), counts, total, count in series:
+                histogram = Histogram(buckets)
+                histogram.counts, histogram.total, histogram.count = counts, total, count
+                lines.extend(histogram.render(name, f'route="{label(route)}",method="{method}"'))
+        for collect in self.gauges:
+            for name, help, samples in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+                for labels, value in samples:
+                    text = ",".join(f'{key}="{label(item)}"' for key, item in labels.items())
+                    lines.append(f"{name}{{{text}}} {value}" if text else f"{name} {value}")
+        return ("\n".join(lines) + "\n").encode()
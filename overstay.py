@@ -0,0 +1,159 @@
+"""Overstay detection kept up to date by the store.
+
+Each occupied spot has a deadline: its entryTime plus the allowed stay (the
+spot's "maxStay" in minutes, or the monitor's default). Deadlines sit in a
+min-heap fed by checkins; checkouts cancel them by dropping the spot from the
+live set, and the stale heap entry is skipped when it surfaces. A timer
+thread sleeps until the earliest deadline, so the cost of checking is
+proportional to the sessions that expire, not to the size of the lot.
+
+When a deadline passes an overstay event is recorded, and the spot is listed
+as overstaying until it is checked out.
+
+An event's id is "<deadline>-<cardId>", with the deadline in microseconds.
+Both come from the spot as stored, so every worker process (each runs its
+own timer) and every restart gives the same event the same id, and ids
+order events by deadline. A spot whose deadline had already passed when it
+was written (an imported stay, say) fires with an id below the newest, so
+clients polling with `since` miss such an event; it is still listed under
+"overstaying".
+"""
+import heapq
+import itertools
+import os
+import threading
+from collections import deque
+
+from spots import decode_time, encode_time, now_micros
+
+DEFAULT_MAX_STAY = 240
+EVENTS_SIZE = 1000
+MINUTE = 60 * 10 ** 6
+# Longest the timer thread sleeps between checks of the heap
+MAX_SLEEP = 60
+
+
+def event_id(deadline, card_id):
+    return f"{deadline}-{card_id}"
+
+
+def parse_event_id(value):
+    # "<deadline>-<cardId>" -> (deadline, card_id); raises ValueError.
+    deadline, separator, card_id = value.partition("-")
+    if not separator or not deadline.isdecimal():
+        raise ValueError("invalid event id")
+    return int(deadline), card_id
+
+
+class OverstayMonitor:
+    def __init__(self, max_stay=DEFAULT_MAX_STAY):
+        self.max_stay = max_stay
+        self.lock = threading.Condition()
+        self.events = deque(maxlen=EVENTS_SIZE)
+        self.last_event = None
+        self._pid = None
+        self._order = itertools.count()
+        self.load(())
+
+    def load(self, cards):
+        with self.lock:
+            self.heap = []
+            self.live = {}
+            self.overstaying = {}
+            for card_id, card in cards:
+                session = self._session(card_id, card)
+                if session is not None:
+                    self.live[card_id] = session
+                    self.heap.append(session)
+            heapq.heapify(self.heap)
+            self.lock.notify()
+
+    def _session(self, card_id, card):
+        # (deadline, tiebreak, card_id, vehicle, entryTime), or None when the
+        # spot has no deadline.
+        if card.get("status") != "occupied":
+            return None
+        entry = encode_time(card.get("entryTime"))
+        if not isinstance(entry, int) or entry < 0:
+            return None
+        max_stay = self.stay(card)
+        if max_stay is None:
+            return None
+        return entry + int(max_stay * MINUTE), next(self._order), card_id, card.get("vehicle"), card.get("entryTime")
+
+    def stay(self, card):
+        # Allowed stay on the spot in minutes, or None for no limit.
+        max_stay = card.get("maxStay", self.max_stay)
+        if type(max_stay) not in (int, float) or max_stay <= 0:
+            return None
+        return max_stay
+
+    def apply(self, card_id, old, new):
+        with self.lock:
+            session = self._session(card_id, new)
+            current = self.live.get(card_id) or self.overstaying.get(card_id)
+            if session is not None and current is not None and (session[0], session[3]) == (current[0], current[3]):
+                return  # same stay, e.g. only the spot version changed
+            self.live.pop(card_id, None)
+            self.overstaying.pop(card_id, None)
+            if session is not None:
+                self.live[card_id] = session
+                heapq.heappush(self.heap, session)
+                if self.heap[0] is session:
+                    self.lock.notify()
+            if len(self.heap) > 2 * len(self.live) + 64:
+                self.heap = [entry for entry in self.heap if self.live.get(entry[2]) is entry]
+                heapq.heapify(self.heap)
+        self._start()
+
+    def fire_due(self, now=None):
+        # Must be called with self.lock held. Records an event for every
+        # deadline up to `now`; returns seconds until the next one.
+        now = now_micros() if now is None else now
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            session = heapq.heappop(heap)
+            deadline, _, card_id, vehicle, entry_time = session
+            if self.live.get(card_id) is not session:
+                continue  # checked out or rescheduled since
+            del self.live[card_id]
+            self.overstaying[card_id] = session
+            self.last_event = max(self.last_event or (deadline, card_id), (deadline, card_id))
+            self.events.append({"id": event_id(deadline, card_id), "type": "overstay", "cardId": card_id,
+                                "vehicle": vehicle, "entryTime": entry_time,
+                                "deadline": decode_time(deadline), "firedAt": decode_time(now)})
+        return (heap[0][0] - now) / 10 ** 6 if heap else None
+
+    def _start(self):
+        # The timer thread does not survive a fork, so each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        with self.lock:
+            while self._pid == pid:
+                delay = self.fire_due()
+                self.lock.wait(MAX_SLEEP if delay is None else min(max(delay, 0), MAX_SLEEP))
+
+    def report(self, since=None, limit=100):
+        # Events with ids after `since` in deadline order, and the spots
+        # overstaying now. Raises ValueError for a malformed `since`.
+        after = parse_event_id(since) if since is not None else None
+        now = now_micros()
+        with self.lock:
+            self.fire_due(now)
+            events = sorted((event for event in self.events if after is None or parse_event_id(event["id"]) > after),
+                            key=lambda event: parse_event_id(event["id"]))[:limit]
+            overstaying = sorted(self.overstaying.items(), key=lambda item: item[1][0])
+            last_event = self.last_event
+        self._start()
+        return {
+            "events": events,
+            "lastEventId": event_id(*last_event) if last_event else None,
+            "overstaying": [{"cardId": card_id, "vehicle": vehicle, "entryTime": entry_time,
+                             "deadline": decode_time(deadline), "overMinutes": round((now - deadline) / MINUTE, 1)}
+                            for card_id, (deadline, _, _, vehicle, entry_time) in overstaying],
+        }
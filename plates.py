@@ -0,0 +1,158 @@
+"""Index of parked vehicles by plate, kept up to date by the store.
+
+Plates are normalised to upper-case letters and digits, so "ka 53 z9021"
+finds "KA-53-Z-9021". Exact lookups hit a dict, prefix lookups bisect a
+sorted list of plates, and partial lookups (a fragment of three or more
+characters from anywhere in the plate, or one with a character misread,
+missing or extra) go through a trigram index, so none of them scan the
+lot. Shorter fragments match as prefixes only; they would match too much
+of the lot to be useful.
+"""
+import bisect
+import heapq
+import re
+
+NON_ALNUM = re.compile(r"[^0-9A-Z]")
+EMPTY = frozenset()
+# Trigrams in more plates than this are too common to be worth
+# intersecting in a partial lookup; candidates are checked against the
+# whole fragment anyway
+COMMON_MAX = 5000
+# Most plates a partial lookup checks for misread characters, across all
+# positions; a position with more candidates than are left is skipped, as
+# a few characters with one of them misread could be thousands of plates
+FUZZY_MAX = 250
+
+
+def normalize_plate(plate):
+    return NON_ALNUM.sub("", plate.upper()) if isinstance(plate, str) else ""
+
+
+def trigrams(plate):
+    return {plate[i:i + 3] for i in range(len(plate) - 2)}
+
+
+def near(plate, left, char, right):
+    # Whether the plate holds left, then char misread, left out, or after
+    # one extra character, then right.
+    start = plate.find(right, len(left))
+    while start >= 0:
+        for gap in (0, 1, 2):
+            end = start - gap
+            if end >= len(left) and plate.endswith(left, 0, end) and (gap < 2 or plate[start - 1] == char):
+                return True
+        start = plate.find(right, start + 1)
+    return False
+
+
+class PlateIndex:
+    def __init__(self):
+        self.load(())
+
+    def load(self, cards):
+        self.spots = {}
+        self.plates = []
+        self.grams = {}
+        for card_id, card in cards:
+            plate = self._plate(card)
+            if plate:
+                self.spots.setdefault(plate, set()).add(card_id)
+        self.plates = sorted(self.spots)
+        for plate in self.plates:
+            for gram in trigrams(plate):
+                self.grams.setdefault(gram, set()).add(plate)
+
+    def _plate(self, card):
+        if card is None or card.get("status") != "occupied":
+            return ""
+        return normalize_plate(card.get("vehicle"))
+
+    def apply(self, card_id, old, new):
+        old_plate, new_plate = self._plate(old), self._plate(new)
+        if old_plate == new_plate:
+            return
+        if old_plate:
+            spots = self.spots[old_plate]
+            spots.discard(card_id)
+            if not spots:
+                del self.spots[old_plate]
+                del self.plates[bisect.bisect_left(self.plates, old_plate)]
+                for gram in trigrams(old_plate):
+                    self.grams[gram].discard(old_plate)
+                    if not self.grams[gram]:
+                        del self.grams[gram]
+        if new_plate:
+            spots = self.spots.get(new_plate)
+            if spots is None:
+                spots = self.spots[new_plate] = set()
+                bisect.insort(self.plates, new_plate)
+                for gram in trigrams(new_plate):
+                    self.grams.setdefault(gram, set()).add(new_plate)
+            spots.add(card_id)
+
+    def exact(self, query):
+        return [query] if query in self.spots else []
+
+    def prefix(self, query, limit):
+        start = bisect.bisect_left(self.plates, query)
+        found = []
+        for plate in self.plates[start:start + limit]:
+            if not plate.startswith(query):
+                break
+            found.append(plate)
+        return found
+
+    def partial(self, query, limit):
+        # Plates containing the fragment first, then plates that would
+        # contain it but for one misread, extra or missing character.
+        if len(query) < 3:
+            return self.prefix(query, limit)
+        grams = [query[i:i + 3] for i in range(len(query) - 2)]
+        # heads[i] holds every trigram of query[:i], tails[i] of query[i:];
+        # None is every plate
+        heads = [None, None] + list(self._narrowing(grams))
+        tails = ([None, None] + list(self._narrowing(reversed(grams))))[::-1]
+        holding = heads[-1]
+        if holding is None:
+            holding = min((self.grams.get(gram, EMPTY) for gram in grams), key=len)
+        contains = heapq.nsmallest(limit, (plate for plate in holding if query in plate))
+        if len(contains) >= limit:
+            return contains
+        close = set()
+        budget = FUZZY_MAX
+        for i in range(len(query)):
+            head, tail = heads[i], tails[i + 1]
+            if head is None and tail is None:
+                continue
+            candidates = tail if head is None else head if tail is None else head & tail
+            if len(candidates) > budget:
+                continue
+            budget -= len(candidates)
+            left, right = query[:i], query[i + 1:]
+            close.update(heapq.nsmallest(limit, (plate for plate in candidates
+                                                 if near(plate, left, query[i], right))))
+        close.difference_update(contains)
+        return contains + heapq.nsmallest(limit - len(contains), close)
+
+    def _narrowing(self, grams):
+        # Plates holding each trigram so far, from None (every plate), or
+        # a superset where common trigrams were left out.
+        found = None
+        yield found
+        for gram in grams:
+            group = self.grams.get(gram, EMPTY)
+            if len(group) <= COMMON_MAX:
+                found = group if found is None else found & group
+            yield found
+
+    def search(self, plate, match="partial", limit=20):
+        # Returns [(plate, card_ids)], best matches first.
+        query = normalize_plate(plate)
+        if not query:
+            return []
+        plates = self.exact(query)
+        if match in ("prefix", "partial") and len(plates) < limit:
+            plates += [found for found in self.prefix(query, limit) if found != query]
+        if match == "partial" and len(plates) < limit:
+            plates += [found for found in self.partial(query, limit) if found not in plates]
+        return [(found, sorted(self.spots[found])) for found in plates[:limit]]
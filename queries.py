@@ -0,0 +1,140 @@
+"""Secondary indexes for filtered, paginated status queries.
+
+StatusIndex is a store index that keeps every spot in a sorted list per
+(zone, status), in natural spot order, and every occupied spot in a sorted
+list of (entry time, spot) per zone. A page of "occupied spots in zone B"
+or "spots entered before 09:00" is a bisect into the matching lists followed
+by a merge of at most `limit` entries, so a filtered view never touches the
+spots it does not return.
+
+Pages are addressed by a cursor: the position of the last spot returned,
+opaque to clients. Writes between pages do not shift the position, so in
+spot order a spot is never returned twice within one walk of a view. A
+view ordered by entry time is different: a spot that checks out and back
+in between pages moves to its new entry time and can be returned again.
+"""
+import base64
+import bisect
+import heapq
+import json
+
+from allocator import DEFAULT_ZONE
+from spots import encode_time
+
+
+def spot_order(card_id):
+    # Natural order: numbered spots by number, then the rest by key.
+    return (0, int(card_id), card_id) if card_id.isdecimal() else (1, 0, card_id)
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Raises ValueError for a cursor this module did not produce.
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+class StatusIndex:
+    def __init__(self):
+        self.load(())
+
+    def load(self, cards):
+        self.buckets = {}
+        self.entries = {}
+        for card_id, card in cards:
+            bucket, entry = self._keys(card_id, card)
+            self.buckets.setdefault(bucket, []).append(spot_order(card_id))
+            if entry is not None:
+                self.entries.setdefault(bucket[0], []).append(entry)
+        for keys in self.buckets.values():
+            keys.sort()
+        for keys in self.entries.values():
+            keys.sort()
+
+    def _keys(self, card_id, card):
+        # ((zone, status), (entry, spot order) or None)
+        zone, status = card.get("zone") or DEFAULT_ZONE, card.get("status")
+        entry = encode_time(card.get("entryTime")) if status == "occupied" else None
+        if not isinstance(entry, int) or entry < 0:
+            entry = None
+        return (zone, status), (entry, spot_order(card_id)) if entry is not None else None
+
+    def apply(self, card_id, old, new):
+        old_keys = self._keys(card_id, old) if old is not None else (None, None)
+        new_keys = self._keys(card_id, new)
+        if old_keys == new_keys:
+            return
+        order = spot_order(card_id)
+        if old_keys[0] is not None:
+            remove(self.buckets[old_keys[0]], order)
+        if old_keys[1] is not None:
+            remove(self.entries[old_keys[0][0]], old_keys[1])
+        bisect.insort(self.buckets.setdefault(new_keys[0], []), order)
+        if new_keys[1] is not None:
+            bisect.insort(self.entries.setdefault(new_keys[0][0], []), new_keys[1])
+
+    def page(self, status=None, zone=None, entered_after=None, entered_before=None, cursor=None, limit=100):
+        # Returns (card_ids, next cursor or None, total matching); cursors are
+        # positions, see encode_cursor(). Entry-time bounds only match
+        # occupied spots. Raises ValueError for a cursor from another view.
+        if entered_after is not None or entered_before is not None:
+            if status not in (None, "occupied"):
+                return [], None, 0
+            return self._entry_page(zone, entered_after, entered_before, cursor, limit)
+        if cursor is not None and not isinstance(cursor, str):
+            raise ValueError("invalid cursor")
+        lists = [keys for (bucket_zone, bucket_status), keys in self.buckets.items()
+                 if (zone is None or bucket_zone == zone) and (status is None or bucket_status == status)]
+        after = spot_order(cursor) if cursor is not None else None
+        ranges = [(keys, bisect.bisect_right(keys, after) if after else 0, len(keys)) for keys in lists]
+        found = take(ranges, limit + 1)
+        card_ids = [order[2] for order in found[:limit]]
+        next_cursor = card_ids[-1] if len(found) > limit else None
+        return card_ids, next_cursor, sum(len(keys) for keys in lists)
+
+    def _entry_page(self, zone, entered_after, entered_before, cursor, limit):
+        if cursor is not None and not (isinstance(cursor, list) and len(cursor) == 2
+                                       and type(cursor[0]) is int and isinstance(cursor[1], str)):
+            raise ValueError("invalid cursor")
+        lists = [keys for entry_zone, keys in self.entries.items() if zone is None or entry_zone == zone]
+        low_key = (entered_after,) if entered_after is not None else None
+        high_key = (entered_before,) if entered_before is not None else None
+        after = (cursor[0], spot_order(cursor[1])) if cursor is not None else None
+        ranges, total = [], 0
+        for keys in lists:
+            low = bisect.bisect_left(keys, low_key) if low_key else 0
+            high = bisect.bisect_left(keys, high_key) if high_key else len(keys)
+            total += max(high - low, 0)
+            if after is not None:
+                low = max(low, bisect.bisect_right(keys, after))
+            ranges.append((keys, low, high))
+        found = take(ranges, limit + 1)
+        card_ids = [order[2] for entry, order in found[:limit]]
+        next_cursor = [found[limit - 1][0], card_ids[-1]] if len(found) > limit else None
+        return card_ids, next_cursor, total
+
+
+def remove(keys, key):
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+def sliced(keys, start, stop):
+    for position in range(start, stop):
+        yield keys[position]
+
+
+def take(ranges, count):
+    # First `count` keys across sorted (list, start, stop) slices, in order.
+    found = []
+    for key in heapq.merge(*(sliced(keys, start, stop) for keys, start, stop in ranges)):
+        found.append(key)
+        if len(found) == count:
+            break
+    return found
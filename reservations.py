@@ -0,0 +1,125 @@
+"""Future reservations per spot, with an index for availability queries.
+
+A spot's reservations are stored on the spot itself, as a "reservations"
+list of {"id", "from", "to", "vehicle", "phone"} sorted by start, so they go
+through the store like any other write: journaled, shared between workers
+and checked for conflicts under the spot's lock. Reservations of one spot
+never overlap, and ones that have ended are pruned on the next write.
+
+ReservationIndex is a store index over every spot's reservations. Besides
+lookup by id, it keeps all reservations in one list sorted by start time. A
+reservation overlapping [start, end) must begin before `end` and no earlier
+than `start` minus the longest reservation, so finding the spots reserved in
+a window bisects that list and looks only at reservations near the window.
+Reservation lengths are kept sorted too, so the longest one stays current
+as reservations are released.
+"""
+import bisect
+import uuid
+
+from plates import normalize_plate
+from spots import decode_time, encode_time, now_micros
+
+MAX_RESERVATION = 30 * 24 * 3600 * 10 ** 6
+
+
+def reservation_times(reservation):
+    return encode_time(reservation.get("from")), encode_time(reservation.get("to"))
+
+
+def conflicts(card, start, end, vehicle=None):
+    # Reservations on the spot overlapping [start, end), other than ones held
+    # by `vehicle`.
+    plate = normalize_plate(vehicle) if vehicle is not None else None
+    found = []
+    for reservation in card.get("reservations") or ():
+        reserved_from, reserved_to = reservation_times(reservation)
+        if not isinstance(reserved_from, int) or not isinstance(reserved_to, int):
+            continue
+        if reserved_from < end and reserved_to > start:
+            if plate and normalize_plate(reservation.get("vehicle")) == plate:
+                continue
+            found.append(reservation)
+    return found
+
+
+def reserve(card, start, end, vehicle, phone):
+    # Adds a reservation to the spot and returns it; raises ValueError on a
+    # conflict with another reservation.
+    now = now_micros()
+    kept = []
+    for reservation in card.get("reservations") or ():
+        reserved_to = reservation_times(reservation)[1]
+        if not isinstance(reserved_to, int) or reserved_to > now:
+            kept.append(reservation)
+    clash = conflicts({"reservations": kept}, start, end)
+    if clash:
+        raise ValueError(f"Spot is reserved from {clash[0]['from']} to {clash[0]['to']}")
+    reservation = {"id": uuid.uuid4().hex[:16], "from": decode_time(start), "to": decode_time(end),
+                   "vehicle": vehicle, "phone": phone}
+    kept.append(reservation)
+    kept.sort(key=lambda item: reservation_times(item)[0] or 0)
+    card["reservations"] = kept
+    return reservation
+
+
+def release(card, reservation_id):
+    # Removes a reservation from the spot; returns it, or None if absent.
+    reservations = card.get("reservations") or []
+    for reservation in reservations:
+        if reservation.get("id") == reservation_id:
+            card["reservations"] = [item for item in reservations if item is not reservation]
+            return reservation
+    return None
+
+
+class ReservationIndex:
+    def __init__(self):
+        self.load(())
+
+    def load(self, cards):
+        self.by_id = {}
+        entries = []
+        for card_id, card in cards:
+            entries.extend(self._entries(card_id, card))
+        for entry in entries:
+            self.by_id[entry[3]] = entry[2]
+        self.starts = sorted(entries)
+        self.lengths = sorted(end - start for start, end, _, _ in entries)
+
+    def _entries(self, card_id, card):
+        # (start, end, card_id, reservation id) for each reservation.
+        entries = []
+        for reservation in (card or {}).get("reservations") or ():
+            start, end = reservation_times(reservation)
+            if isinstance(start, int) and isinstance(end, int) and end > start:
+                entries.append((start, end, card_id, str(reservation.get("id"))))
+        return entries
+
+    def apply(self, card_id, old, new):
+        old_entries, new_entries = self._entries(card_id, old), self._entries(card_id, new)
+        if old_entries == new_entries:
+            return
+        for entry in old_entries:
+            position = bisect.bisect_left(self.starts, entry)
+            if position < len(self.starts) and self.starts[position] == entry:
+                del self.starts[position]
+                del self.lengths[bisect.bisect_left(self.lengths, entry[1] - entry[0])]
+            self.by_id.pop(entry[3], None)
+        for entry in new_entries:
+            bisect.insort(self.starts, entry)
+            bisect.insort(self.lengths, entry[1] - entry[0])
+            self.by_id[entry[3]] = card_id
+
+    @property
+    def longest(self):
+        return self.lengths[-1] if self.lengths else 0
+
+    def spot_of(self, reservation_id):
+        return self.by_id.get(reservation_id)
+
+    def reserved(self, start, end):
+        # Ids of spots with a reservation overlapping [start, end).
+        low = bisect.bisect_left(self.starts, (start - self.longest,))
+        high = bisect.bisect_left(self.starts, (end,))
+        return {card_id for reserved_from, reserved_to, card_id, _ in self.starts[low:high] if reserved_to > start}
@@ -0,0 +1,246 @@
+"""Routes requests for many facilities (lots) to the shards that own them.
+
+Each facility is served by its own shard: an app.py/asgi.py process with
+its own store, started with SMARTPARK_FACILITY set to the facility's id.
+Lots never share a process, so a busy lot cannot starve the others, and
+shards can run on any core or node the router can reach.
+
+    SMARTPARK_SHARDS="main=http://127.0.0.1:5101,north=http://10.0.0.7:5000" \\
+        uvicorn router:app --port 5000
+    python router.py --spawn main,north,south --data ./lots
+
+With --spawn the router starts one local shard per facility (on ports from
+--base-port up) and stops them when it exits; --data gives each shard a
+journal directory under it.
+
+Requests for /facilities/<facility>/<path> go to <path> on the facility's
+shard, so the dashboard works unchanged at /facilities/<facility>/. Plain
+/api/... requests are routed by a ?facility= parameter or an X-Facility
+header. Without either they get a 400 unless there is only one facility,
+so a gate that forgot to name its lot cannot write to another one.
+/api/facilities lists the facilities with their occupancy.
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+# Headers that describe one connection and must not be forwarded
+HOP_HEADERS = {b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te",
+               b"trailer", b"transfer-encoding", b"upgrade", b"host"}
+# Response headers the router's own server sets; forwarding them would send
+# them twice
+SERVER_HEADERS = {b"date", b"server"}
+FACILITY_PREFIX = "/facilities/"
+
+
+def parse_shards(text):
+    # "main=http://host:port,north=..." -> {"main": "http://host:port", ...}
+    shards = {}
+    for part in (text or "").split(","):
+        facility, _, url = part.strip().partition("=")
+        if facility and url:
+            shards[facility] = url.rstrip("/")
+    return shards
+
+
+class Router:
+    def __init__(self, shards):
+        self.shards = shards
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use so it belongs to the server's event loop.
+        # Reads have no timeout: long-polls and streams stay open by design.
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10, read=None),
+                                             limits=httpx.Limits(max_connections=None, max_keepalive_connections=100))
+        return self._client
+
+    def route(self, scope):
+        # Returns (facility, path on the shard); facility is None when the
+        # request does not name one and there is more than one to choose.
+        path = scope["path"]
+        if path.startswith(FACILITY_PREFIX):
+            facility, _, rest = path[len(FACILITY_PREFIX):].partition("/")
+            return facility, "/" + rest
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        headers = dict(scope["headers"])
+        facility = (query.get("facility") or [None])[0] or headers.get(b"x-facility", b"").decode("latin-1")
+        if not facility and len(self.shards) == 1:
+            facility = next(iter(self.shards))
+        return facility or None, path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/api/facilities":
+            return await self.facilities(send)
+        # Redirects keep the query string, so ?card= scan links still work
+        query = scope.get("query_string", b"").decode("latin-1")
+        query = "?" + query if query else ""
+        if scope["path"] == "/":
+            return await self.redirect(send, f"{FACILITY_PREFIX}{next(iter(self.shards), '')}/{query}")
+        if scope["path"].startswith(FACILITY_PREFIX) and scope["path"].count("/") == 2:
+            return await self.redirect(send, scope["path"] + "/" + query)
+        facility, path = self.route(scope)
+        if facility is None:
+            return await respond_json(send, 400, {"error": "Name the facility with ?facility= or an X-Facility header"})
+        if facility not in self.shards:
+            return await respond_json(send, 404, {"error": f"Unknown facility: {facility}"})
+        await self.forward(scope, receive, send, facility, path)
+
+    async def forward(self, scope, receive, send, facility, path):
+        # Bodies are streamed to the shard, so large imports are never
+        # buffered here
+        headers = dict(scope["headers"])
+        body = body_chunks(receive) if b"content-length" in headers or b"transfer-encoding" in headers else b""
+        url = self.shards[facility] + path
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [(name, value) for name, value in scope["headers"] if name not in HOP_HEADERS]
+        # httpx would otherwise ask for gzip on the client's behalf, and the
+        # raw body is passed through undecoded
+        if b"accept-encoding" not in dict(headers):
+            headers.append((b"accept-encoding", b"identity"))
+        request = self.client.build_request(scope["method"], url, headers=headers, content=body)
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.HTTPError:
+            return await respond_json(send, 502, {"error": f"Facility {facility} is unavailable"})
+
+        async def pump():
+            # Raw bytes, so compressed bodies pass through untouched
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": [(name, value) for name, value in response.headers.raw
+                                    if name.lower() not in HOP_HEADERS | SERVER_HEADERS]})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        tasks = {asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())}
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+        finally:
+            await response.aclose()
+
+    async def facilities(self, send):
+        async def occupancy(facility, url):
+            try:
+                response = await self.client.get(url + "/api/occupancy", timeout=5)
+                response.raise_for_status()
+                return {"id": facility, "occupancy": response.json()}
+            except (httpx.HTTPError, ValueError):
+                return {"id": facility, "error": "unavailable"}
+
+        found = await asyncio.gather(*(occupancy(facility, url) for facility, url in self.shards.items()))
+        await respond_json(send, 200, {"facilities": found})
+
+    async def redirect(self, send, location):
+        await send({"type": "http.response.start", "status": 307,
+                    "headers": [(b"location", location.encode()), (b"content-length", b"0")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._client is not None:
+                    await self._client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def body_chunks(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        yield message.get("body", b"")
+        if not message.get("more_body"):
+            return
+
+
+async def respond_json(send, status, body):
+    body = json.dumps(body, separators=(",", ":")).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def spawn(facilities, base_port, data):
+    # Starts one local shard per facility; returns {facility: url}.
+    shards, processes = {}, []
+    root = os.path.dirname(os.path.abspath(__file__))
+    for offset, facility in enumerate(facilities):
+        port = base_port + offset
+        env = dict(os.environ, SMARTPARK_FACILITY=facility)
+        if data:
+            env["SMARTPARK_JOURNAL"] = os.path.join(data, facility)
+            os.makedirs(env["SMARTPARK_JOURNAL"], exist_ok=True)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"], cwd=root, env=env))
+        shards[facility] = f"http://127.0.0.1:{port}"
+
+    def stop():
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    atexit.register(stop)
+    return shards
+
+
+def wait_for_shards(shards, timeout=30):
+    deadline = time.monotonic() + timeout
+    for url in shards.values():
+        while True:
+            try:
+                httpx.get(url + "/api/facility", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"shard at {url} did not start")
+                time.sleep(0.1)
+
+
+app = Router(parse_shards(os.environ.get("SMARTPARK_SHARDS")))
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Route SmartPark requests to per-facility shards.")
+    parser.add_argument("--spawn", help="comma-separated facilities to start local shards for")
+    parser.add_argument("--base-port", type=int, default=5101, help="port of the first spawned shard")
+    parser.add_argument("--data", help="directory for the spawned shards' journals")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    if args.spawn:
+        app.shards.update(spawn([name for name in args.spawn.split(",") if name], args.base_port, args.data))
+        wait_for_shards(app.shards)
+    if not app.shards:
+        parser.error("no shards: set SMARTPARK_SHARDS or use --spawn")
+    uvicorn.run(app, port=args.port, limit_concurrency=20000)
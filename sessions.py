@@ -0,0 +1,143 @@
+"""Columnar log of completed parking sessions.
+
+The store discards a session when the spot is checked out, so SessionLog is
+registered as a store index and records one row per checkout: the spot,
+the entry time and the exit time, both in microseconds since 1970 (naive
+local time, like entryTime). Each field is a NumPy column that grows by
+doubling, so analytics.py can compute reports over the whole history
+without building Python objects.
+
+Given a directory, the log also appends each row to one file per column
+(entry.i8, exit.i8, spot.i4 and the spot keys in keys.txt) and reloads them
+on start-up. Rows are flushed but not fsynced, so a crash can drop the last
+few sessions.
+
+The SQLite store records sessions itself, in a table written in the same
+transaction as the checkout. Given that store as its `source`, the log
+reads new rows from the table whenever a snapshot is taken, so every worker
+sees the same durable history.
+"""
+import os
+
+import numpy as np
+
+from spots import encode_time, now_micros
+
+INITIAL_CAPACITY = 1024
+# Rows read from a source per query
+SYNC_BATCH = 100000
+COLUMNS = (("entry", np.int64, "entry.i8"), ("exit", np.int64, "exit.i8"), ("spot", np.int32, "spot.i4"))
+
+
+def ended_session(old, new):
+    # Entry time (microseconds) of the session a write ends, or None. A
+    # session ends when an occupied spot stops being occupied.
+    if old is None or old.get("status") != "occupied" or new.get("status") == "occupied":
+        return None
+    entry = encode_time(old.get("entryTime"))
+    if not isinstance(entry, int) or entry < 0:
+        return None
+    return entry
+
+
+class SessionLog:
+    def __init__(self, directory=None, source=None):
+        self.directory = directory
+        self.source = source
+        self.synced = 0
+        self.count = 0
+        self.keys = []
+        self.key_index = {}
+        self.columns = {name: np.empty(INITIAL_CAPACITY, dtype) for name, dtype, _ in COLUMNS}
+        self._files = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._open()
+
+    def _open(self):
+        keys_path = os.path.join(self.directory, "keys.txt")
+        if os.path.exists(keys_path):
+            with open(keys_path, encoding="utf-8") as f:
+                self.keys = f.read().splitlines()
+            self.key_index = {key: i for i, key in enumerate(self.keys)}
+        loaded = {}
+        for name, dtype, filename in COLUMNS:
+            path = os.path.join(self.directory, filename)
+            loaded[name] = np.fromfile(path, dtype) if os.path.exists(path) else np.empty(0, dtype)
+        # A crash between column writes leaves the last row partial
+        count = min(len(column) for column in loaded.values())
+        self._reserve(count)
+        for name, dtype, filename in COLUMNS:
+            self.columns[name][:count] = loaded[name][:count]
+            path = os.path.join(self.directory, filename)
+            with open(path, "ab") as f:
+                f.truncate(count * np.dtype(dtype).itemsize)
+            self._files[name] = open(path, "ab")
+        self._files["keys"] = open(keys_path, "a", encoding="utf-8")
+        self.count = count
+
+    def _reserve(self, count):
+        capacity = len(self.columns["entry"])
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.columns[name] = grown
+
+    def _spot(self, card_id):
+        index = self.key_index.get(card_id)
+        if index is None:
+            index = self.key_index[card_id] = len(self.keys)
+            self.keys.append(card_id)
+            if self._files:
+                self._files["keys"].write(card_id + "\n")
+                self._files["keys"].flush()
+        return index
+
+    def load(self, cards):
+        # History is not derived from the current spots, so a reload of the
+        # store leaves it alone.
+        pass
+
+    def apply(self, card_id, old, new):
+        if self.source is not None:
+            return  # recorded by the store, see sync()
+        entry = ended_session(old, new)
+        if entry is not None:
+            self.append(card_id, entry, now_micros())
+
+    def append(self, card_id, entry, exit):
+        self._reserve(self.count + 1)
+        row = {"entry": entry, "exit": exit, "spot": self._spot(card_id)}
+        for name, value in row.items():
+            self.columns[name][self.count] = value
+        self.count += 1
+        if self._files:
+            for name, dtype, _ in COLUMNS:
+                self._files[name].write(np.array(row[name], dtype).tobytes())
+                self._files[name].flush()
+
+    def sync(self):
+        # Appends the rows the source has recorded since the last sync.
+        while True:
+            rows = self.source.sessions_since(self.synced, SYNC_BATCH)
+            if not rows:
+                return
+            self._reserve(self.count + len(rows))
+            end = self.count + len(rows)
+            self.columns["entry"][self.count:end] = [row[2] for row in rows]
+            self.columns["exit"][self.count:end] = [row[3] for row in rows]
+            self.columns["spot"][self.count:end] = [self._spot(row[1]) for row in rows]
+            self.count = end
+            self.synced = rows[-1][0]
+
+    def snapshot(self):
+        # Returns ({column: array}, keys) covering the rows logged so far.
+        # Must be called with the store lock held; the arrays are views that
+        # later appends do not change.
+        if self.source is not None:
+            self.sync()
+        return {name: column[:self.count] for name, column in self.columns.items()}, list(self.keys)
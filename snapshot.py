@@ -0,0 +1,174 @@
+"""Compact binary snapshot of the spot table, read through mmap.
+
+A snapshot is a header, one fixed-width record per spot sorted by spot key,
+and a table of interned UTF-8 strings:
+
+    header   magic, state version, record count, string table offset
+    records  key, id, status, vehicle, phone, entryTime, version, extra
+             (JSON of any field that does not fit the fixed columns)
+    strings  every distinct string once, referenced by (offset, length)
+
+Opening a snapshot only maps the file and reads the header; spots are
+decoded on access and found by binary search over the sorted keys.
+MappedSpots layers the spots written since the snapshot over it. Start-up
+still grows with the lot: the store's derived indexes (see
+MemoryStore.add_index) decode every spot once when they are loaded.
+"""
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+
+from spots import SpotTable, decode_card, encode_card
+
+MAGIC = b"SPSNAP02"
+HEADER = struct.Struct("<8sQQQ")
+RECORD = struct.Struct("<IIqB3xIIIIqqII")
+NO_STRING = 0xFFFFFFFF
+
+
+def write_snapshot(path, version, cards):
+    strings = bytearray()
+    interned = {}
+
+    def ref(value):
+        if value is None:
+            return NO_STRING, 0
+        data = value.encode()
+        offset = interned.get(data)
+        if offset is None:
+            offset = interned[data] = len(strings)
+            strings.extend(data)
+        return offset, len(data)
+
+    records = []
+    for card_id, card in sorted(cards.items(), key=lambda item: item[0].encode()):
+        number, status, vehicle, phone, entry, spot_version, extra = encode_card(card)
+        records.append(RECORD.pack(*ref(card_id), number, status, *ref(vehicle), *ref(phone), entry, spot_version,
+                                   *ref(json.dumps(extra) if extra else None)))
+
+    strings_offset = HEADER.size + RECORD.size * len(records)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, version, len(records), strings_offset))
+        f.writelines(records)
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class MappedSnapshot:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.count, self._strings = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a spot snapshot")
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._map[start:start + length]
+
+    def _key(self, index):
+        key_offset, key_length = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)[:2]
+        return self._string(key_offset, key_length)
+
+    def find(self, key):
+        # Binary search over the sorted keys; -1 when absent.
+        target = key.encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key(low) == target:
+            return low
+        return -1
+
+    def _text(self, offset, length):
+        return None if offset == NO_STRING else self._string(offset, length).decode()
+
+    def decode(self, index):
+        (_, _, number, status, vehicle_offset, vehicle_length, phone_offset, phone_length,
+         entry, version, extra_offset, extra_length) = self._record(index)
+        extra = self._text(extra_offset, extra_length)
+        return decode_card(number, status, self._text(vehicle_offset, vehicle_length),
+                           self._text(phone_offset, phone_length), entry, version,
+                           json.loads(extra) if extra else None)
+
+    def get(self, key):
+        index = self.find(key)
+        return self.decode(index) if index >= 0 else None
+
+    def keys(self):
+        for index in range(self.count):
+            yield self._key(index).decode()
+
+    def items(self):
+        for index in range(self.count):
+            yield self._key(index).decode(), self.decode(index)
+
+
+class MappedSpots(MutableMapping):
+    """Spot table served from a MappedSnapshot, with spots written since the
+    snapshot kept in a SpotTable that shadows the mapped records."""
+
+    def __init__(self, base):
+        self.base = base
+        self.written = SpotTable()
+        self._added = 0
+
+    def __getitem__(self, key):
+        card = self.written.get(key)
+        if card is None:
+            card = self.base.get(key)
+            if card is None:
+                raise KeyError(key)
+        return card
+
+    def __setitem__(self, key, card):
+        if key not in self.written and self.base.find(key) < 0:
+            self._added += 1
+        self.written[key] = card
+
+    def __delitem__(self, key):
+        raise TypeError("spots cannot be deleted from a snapshot-backed table")
+
+    def __contains__(self, key):
+        return key in self.written or self.base.find(key) >= 0
+
+    def __iter__(self):
+        for key in self.base.keys():
+            yield key
+        for key in self.written:
+            if self.base.find(key) < 0:
+                yield key
+
+    def __len__(self):
+        return len(self.base) + self._added
+
+    def items(self):
+        base = self.base
+        for index in range(base.count):
+            key = base._key(index).decode()
+            yield key, self.written[key] if key in self.written else base.decode(index)
+        for key, card in self.written.items():
+            if self.base.find(key) < 0:
+                yield key, card
+
+    def copy(self):
+        # O(spots written since the snapshot); the mapped base is shared.
+        spots = MappedSpots(self.base)
+        spots.written = self.written.copy()
+        spots._added = self._added
+        return spots
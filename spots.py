@@ -0,0 +1,293 @@
+"""Compact columnar spot table.
+
+A spot is stored as one row across typed columns instead of a dict per spot:
+a status byte, the spot number, entry time (in microseconds since 1970) and
+spot version as 64-bit integers, maxStay as a double, and vehicle plate,
+phone, zone and type as indexes into a reference-counted table of interned
+strings. Fields that do not fit those columns are kept in a sparse per-row
+dict. Spots are decoded back into the
+JSON shape the API serves only when they are read.
+"""
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+
+NO_ID = -(2 ** 63)
+NO_VERSION = -(2 ** 63)
+NO_TIME = -(2 ** 63)
+NULL_TIME = NO_TIME + 1
+NO_STRING = -1
+STATUSES = {"empty": 1, "occupied": 2}
+STATUS_NAMES = {code: name for name, code in STATUSES.items()}
+EPOCH = datetime(1970, 1, 1)
+FIXED_FIELDS = ("id", "status", "vehicle", "entryTime", "phone", "version")
+NO_STAY = float("nan")
+
+
+def encode_time(value):
+    # entryTime is a naive ISO string; it gets a column only when it
+    # round-trips exactly, otherwise it is left to the extra fields.
+    if value is None:
+        return NULL_TIME
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None or parsed.isoformat() != value:
+        return None
+    return (parsed - EPOCH) // timedelta(microseconds=1)
+
+
+def decode_time(value):
+    if value == NULL_TIME:
+        return None
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def parse_time(value):
+    # ISO date or naive datetime from a request -> microseconds since 1970;
+    # None passes through, anything else raises ValueError.
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        raise ValueError("times must not carry a timezone")
+    return (parsed - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_stay(value):
+    # maxStay gets the float column only when it decodes back unchanged:
+    # whole minutes are ints (as the importer writes them), fractions floats.
+    if type(value) is int and abs(value) < 2 ** 53:
+        return float(value)
+    if type(value) is float and not value.is_integer() and value == value:
+        return value
+    return None
+
+
+def decode_stay(value):
+    return int(value) if value.is_integer() else value
+
+
+def now_micros():
+    return (datetime.now() - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_card(card):
+    # Returns (id, status, vehicle, phone, entry, version, extra); vehicle
+    # and phone are str or None, extra is a dict of everything else
+    # (possibly empty).
+    extra = {key: value for key, value in card.items() if key not in FIXED_FIELDS}
+    integers = {}
+    for key in ("id", "version"):
+        if key not in card:
+            integers[key] = NO_ID
+        elif type(card[key]) is int and card[key] != NO_ID:
+            integers[key] = card[key]
+        else:
+            extra[key] = card[key]
+            integers[key] = NO_ID
+    status = STATUSES.get(card.get("status"), 0)
+    if not status and "status" in card:
+        extra["status"] = card["status"]
+    text = {}
+    for key in ("vehicle", "phone"):
+        if isinstance(card.get(key), str):
+            text[key] = card[key]
+        elif key in card:
+            extra[key] = card[key]
+    entry = NO_TIME
+    if "entryTime" in card:
+        entry = encode_time(card["entryTime"])
+        if entry is None:
+            extra["entryTime"] = card["entryTime"]
+            entry = NO_TIME
+    return integers["id"], status, text.get("vehicle"), text.get("phone"), entry, integers["version"], extra
+
+
+def decode_card(number, status, vehicle, phone, entry, version, extra):
+    card = {}
+    if number != NO_ID:
+        card["id"] = number
+    if status:
+        card["status"] = STATUS_NAMES[status]
+    if vehicle is not None:
+        card["vehicle"] = vehicle
+    if entry != NO_TIME:
+        card["entryTime"] = decode_time(entry)
+    if phone is not None:
+        card["phone"] = phone
+    if version != NO_VERSION:
+        card["version"] = version
+    if extra:
+        card.update(extra)
+    return card
+
+
+class StringTable:
+    """Interned strings with reference counts; freed slots are reused."""
+
+    def __init__(self):
+        self.strings = []
+        self.refs = array("I")
+        self.index = {}
+        self.free = []
+
+    def intern(self, value):
+        if value is None:
+            return NO_STRING
+        slot = self.index.get(value)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.strings[slot] = value
+            else:
+                slot = len(self.strings)
+                self.strings.append(value)
+                self.refs.append(0)
+            self.index[value] = slot
+        self.refs[slot] += 1
+        return slot
+
+    def release(self, slot):
+        if slot == NO_STRING:
+            return
+        self.refs[slot] -= 1
+        if not self.refs[slot]:
+            del self.index[self.strings[slot]]
+            self.strings[slot] = None
+            self.free.append(slot)
+
+    def get(self, slot):
+        return None if slot == NO_STRING else self.strings[slot]
+
+    def copy(self):
+        table = StringTable()
+        table.strings = list(self.strings)
+        table.refs = array("I", self.refs)
+        table.index = dict(self.index)
+        table.free = list(self.free)
+        return table
+
+
+class SpotTable(MutableMapping):
+    """Spot key -> spot mapping stored column-wise. Reads return a freshly
+    decoded dict; writes replace the whole spot."""
+
+    def __init__(self, cards=()):
+        self.spot_keys = []
+        self.rows = {}
+        self.ids = array("q")
+        self.statuses = bytearray()
+        self.vehicles = array("i")
+        self.phones = array("i")
+        self.entries = array("q")
+        self.versions = array("q")
+        self.zones = array("i")
+        self.types = array("i")
+        self.max_stays = array("d")
+        self.extras = {}
+        self.strings = StringTable()
+        for key, card in cards:
+            self[key] = card
+
+    def decode(self, row):
+        extra = self.extras.get(row)
+        zone, spot_type, max_stay = self.zones[row], self.types[row], self.max_stays[row]
+        if zone != NO_STRING or spot_type != NO_STRING or max_stay == max_stay:
+            columns = {}
+            if zone != NO_STRING:
+                columns["zone"] = self.strings.get(zone)
+            if spot_type != NO_STRING:
+                columns["type"] = self.strings.get(spot_type)
+            if max_stay == max_stay:
+                columns["maxStay"] = decode_stay(max_stay)
+            extra = {**columns, **extra} if extra else columns
+        return decode_card(self.ids[row], self.statuses[row], self.strings.get(self.vehicles[row]),
+                           self.strings.get(self.phones[row]), self.entries[row], self.versions[row],
+                           extra)
+
+    def __getitem__(self, key):
+        return self.decode(self.rows[key])
+
+    def __setitem__(self, key, card):
+        number, status, vehicle, phone, entry, version, extra = encode_card(card)
+        vehicle = self.strings.intern(vehicle)
+        phone = self.strings.intern(phone)
+        zone = spot_type = None
+        if isinstance(extra.get("zone"), str):
+            zone = extra.pop("zone")
+        if isinstance(extra.get("type"), str):
+            spot_type = extra.pop("type")
+        zone, spot_type = self.strings.intern(zone), self.strings.intern(spot_type)
+        max_stay = encode_stay(extra.get("maxStay"))
+        if max_stay is None:
+            max_stay = NO_STAY
+        else:
+            del extra["maxStay"]
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.spot_keys)
+            self.spot_keys.append(key)
+            self.ids.append(number)
+            self.statuses.append(status)
+            self.vehicles.append(vehicle)
+            self.phones.append(phone)
+            self.entries.append(entry)
+            self.versions.append(version)
+            self.zones.append(zone)
+            self.types.append(spot_type)
+            self.max_stays.append(max_stay)
+        else:
+            self.strings.release(self.vehicles[row])
+            self.strings.release(self.phones[row])
+            self.strings.release(self.zones[row])
+            self.strings.release(self.types[row])
+            self.ids[row] = number
+            self.statuses[row] = status
+            self.vehicles[row] = vehicle
+            self.phones[row] = phone
+            self.entries[row] = entry
+            self.versions[row] = version
+            self.zones[row] = zone
+            self.types[row] = spot_type
+            self.max_stays[row] = max_stay
+        if extra:
+            self.extras[row] = extra
+        else:
+            self.extras.pop(row, None)
+
+    def __delitem__(self, key):
+        raise TypeError("spots cannot be deleted from a spot table")
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.spot_keys)
+
+    def __len__(self):
+        return len(self.spot_keys)
+
+    def items(self):
+        for row, key in enumerate(self.spot_keys):
+            yield key, self.decode(row)
+
+    def copy(self):
+        table = SpotTable()
+        table.spot_keys = list(self.spot_keys)
+        table.rows = dict(self.rows)
+        table.ids = array("q", self.ids)
+        table.statuses = bytearray(self.statuses)
+        table.vehicles = array("i", self.vehicles)
+        table.phones = array("i", self.phones)
+        table.entries = array("q", self.entries)
+        table.versions = array("q", self.versions)
+        table.zones = array("i", self.zones)
+        table.types = array("i", self.types)
+        table.max_stays = array("d", self.max_stays)
+        table.extras = {row: dict(extra) for row, extra in self.extras.items()}
+        table.strings = self.strings.copy()
+        return table
@@ -0,0 +1,371 @@
+"""Storage backends for the spot table.
+
+MemoryStore keeps the lot in the current process, optionally made durable
+by a Journal (see journal.py). SQLiteStore keeps it in a
+WAL-mode SQLite file shared by every worker process; each process holds a
+mirror of the table that it refreshes from the database's version counter,
+so reads stay in memory and writes are atomic across processes.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from journal import Journal
+from sessions import ended_session
+from spots import SpotTable, now_micros
+
+CHANGELOG_SIZE = 10000
+WATCH_INTERVAL = 0.05
+LOCK_STRIPES = 64
+IDEMPOTENCY_SIZE = 10000
+IDEMPOTENCY_TTL = 24 * 3600
+
+
+class UpdateRejected(Exception):
+    """Raised by an update's apply() to refuse the write."""
+
+
+class MemoryStore:
+    def __init__(self, cards, journal=None):
+        # self.cards is a spots.SpotTable, or a snapshot.MappedSpots when
+        # recovered from a journal snapshot; both decode spots on read and
+        # replace them whole on write.
+        if journal is not None:
+            version, self.cards = journal.recover(cards)
+        else:
+            version, self.cards = 0, SpotTable(cards.items())
+        self.journal = journal
+        # Derived indexes (e.g. allocator.Allocator) see every write through
+        # load(items) and apply(card_id, old, new), called with the lock held.
+        self.indexes = []
+        # Callbacks run (with the lock held) after every write, e.g. to wake
+        # the ASGI server's event loop; they must not block.
+        self.watchers = []
+        self.lock = threading.Lock()
+        self.stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # Outcomes of the last IDEMPOTENCY_SIZE requests by idempotency key,
+        # in the order they were first seen. Eviction is FIFO, not LRU: the
+        # oldest key goes first even if it was just replayed.
+        self.seen = OrderedDict()
+        self.changed = threading.Condition(self.lock)
+        self.version = version
+        # The changelog covers every write after log_floor; older clients
+        # have to resync in full.
+        self.changelog = deque(maxlen=CHANGELOG_SIZE)
+        self.log_floor = version
+
+    @property
+    def durable(self):
+        # Whether writes outlive the process
+        return self.journal is not None
+
+    def refresh(self):
+        pass
+
+    def add_index(self, *indexes):
+        # Loads the indexes from one decoding pass over the lot; register
+        # them together, since decoding dominates the cost of a load. This
+        # pass is linear in the lot and is most of the start-up time of a
+        # store recovered from a snapshot.
+        with self.lock:
+            self.refresh()
+            self._load(indexes)
+            self.indexes.extend(indexes)
+
+    def _load(self, indexes):
+        # Must be called with the lock held.
+        cards = list(self.cards.items())
+        for index in indexes:
+            index.load(cards)
+
+    def as_dict(self):
+        # Must be called with the lock held. Builds the JSON shape of the
+        # whole lot, so keep it off per-request paths that can be cached.
+        return dict(self.cards.items())
+
+    def get(self, card_id):
+        with self.lock:
+            self.refresh()
+            return self.cards.get(card_id)
+
+    def update(self, card_id, apply, key=None):
+        # apply() gets a decoded copy of the spot and returns the new spot, or
+        # None to leave it untouched; it may raise UpdateRejected. Returns the
+        # spot as stored, or None if the spot is unknown.
+        result = self.update_many([(card_id, apply)], key=key)[0][0]
+        if isinstance(result, UpdateRejected):
+            raise result
+        return result
+
+    def update_many(self, updates, atomic=False, key=None, create=False):
+        # Applies [(card_id, apply)] in order, so later items see the effect
+        # of earlier ones. Returns (results, applied) where each result is the
+        # spot as stored, None for an unknown spot, or the UpdateRejected its
+        # apply() raised. With atomic=True nothing is written unless every
+        # item succeeds. A repeated idempotency `key` returns the outcome of
+        # the first request without applying anything. With create=True an
+        # unknown spot is passed to apply() as {} and created.
+        #
+        # Spots are locked by stripe while their updates are staged, so gates
+        # working on different spots do not wait for each other; the store
+        # lock is only held to publish the staged writes.
+        stripes = sorted({hash(card_id) % LOCK_STRIPES for card_id, _ in updates})
+        for stripe in stripes:
+            self.stripes[stripe].acquire()
+        try:
+            if key is not None:
+                with self.lock:
+                    outcome = self.seen.get(key)
+                if outcome is not None:
+                    return outcome
+            results, staged = self._stage(updates, create)
+            applied = not atomic or all(isinstance(result, dict) for result in results)
+            ticket = None
+            with self.lock:
+                if staged and applied:
+                    ticket = self._commit(staged)
+                self._remember(key, (results, applied))
+        finally:
+            for stripe in reversed(stripes):
+                self.stripes[stripe].release()
+        if ticket is not None:
+            # Group commit: block until the committer has fsynced our entries
+            self.journal.wait(ticket)
+        return results, applied
+
+    def _stage(self, updates, create=False):
+        results, staged = [], {}
+        for card_id, apply in updates:
+            card = staged.get(card_id) or self.cards.get(card_id)
+            if card is None and create:
+                card = {}
+            if card is None:
+                results.append(None)
+                continue
+            try:
+                new = apply(dict(card))
+            except UpdateRejected as error:
+                results.append(error)
+                continue
+            if new is not None:
+                staged[card_id] = card = new
+            results.append(card)
+        return results, staged
+
+    def _remember(self, key, outcome):
+        # Must be called with the lock held.
+        if key is None:
+            return
+        self.seen[key] = outcome
+        if len(self.seen) > IDEMPOTENCY_SIZE:
+            self.seen.popitem(last=False)
+
+    def _commit(self, staged):
+        # Must be called with the lock held. Stamps each spot with the state
+        # version it was written at; returns a journal ticket, if any.
+        ticket = None
+        for card_id, card in staged.items():
+            card["version"] = self.version + 1
+            self._record(card_id, card, self.version + 1)
+            if self.journal is not None:
+                ticket = self.journal.append(self.version, card_id, card)
+        if self.journal is not None and self.journal.should_compact():
+            self.journal.compact(self.version, self.cards.copy())
+        return ticket
+
+    def _record(self, card_id, card, version):
+        # Must be called with the lock held.
+        old = self.cards.get(card_id)
+        self.cards[card_id] = card
+        for index in self.indexes:
+            index.apply(card_id, old, card)
+        self.version = version
+        if len(self.changelog) == self.changelog.maxlen:
+            self.log_floor = self.changelog[0][0]
+        self.changelog.append((version, card_id))
+        self.changed.notify_all()
+        for watcher in self.watchers:
+            watcher()
+
+    def changes_since(self, since):
+        # Must be called with the lock held. Returns None when the changelog
+        # no longer reaches back to `since` (or the client is ahead of us,
+        # e.g. after a restart) and a full resync is needed.
+        if since == self.version:
+            return {}
+        if since > self.version or since < self.log_floor:
+            return None
+        changed = set()
+        for version, card_id in reversed(self.changelog):
+            if version <= since:
+                break
+            changed.add(card_id)
+        return {card_id: self.cards[card_id] for card_id in changed}
+
+    def wait_for_change(self, since, timeout):
+        # Must be called with the lock held; returns as soon as a write lands.
+        return self.changed.wait_for(lambda: self.version != since, timeout)
+
+
+class SQLiteStore(MemoryStore):
+    durable = True
+
+    def __init__(self, path, cards):
+        super().__init__({})
+        self.path = path
+        self._pid = None
+        self._conn = None
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO spots (id, data, version) VALUES (?, ?, 0)",
+                    [(card_id, json.dumps(card)) for card_id, card in cards.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._reload(conn)
+
+    def _connect(self):
+        # Connections and the watcher thread do not survive a fork, so each
+        # worker process opens its own.
+        if self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("CREATE TABLE IF NOT EXISTS spots (id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS spots_version ON spots (version)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        conn.execute("CREATE TABLE IF NOT EXISTS requests (key TEXT PRIMARY KEY, outcome TEXT NOT NULL, created REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS requests_created ON requests (created)")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "card_id TEXT NOT NULL, entry INTEGER NOT NULL, exit INTEGER NOT NULL)")
+        self._conn, self._pid = conn, os.getpid()
+        threading.Thread(target=self._watch, daemon=True).start()
+        return conn
+
+    def _db_version(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _reload(self, conn):
+        self.cards = SpotTable((card_id, json.loads(data)) for card_id, data in conn.execute("SELECT id, data FROM spots"))
+        self.version = self._db_version(conn)
+        self.changelog.clear()
+        self.log_floor = self.version
+        self._load(self.indexes)
+        self.changed.notify_all()
+        for watcher in self.watchers:
+            watcher()
+
+    def refresh(self):
+        # Must be called with the lock held. Pulls in writes made by other
+        # processes since our mirror's version.
+        conn = self._connect()
+        version = self._db_version(conn)
+        if version == self.version:
+            return
+        if version < self.version:
+            self._reload(conn)
+            return
+        rows = conn.execute("SELECT id, data, version FROM spots WHERE version > ? ORDER BY version",
+                            (self.version,)).fetchall()
+        for card_id, data, row_version in rows:
+            self._record(card_id, json.loads(data), row_version)
+        self.version = version
+
+    def _watch(self):
+        # Wakes up local waiters (long-polls, streams) for remote writes.
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(WATCH_INTERVAL)
+            with self.lock:
+                self.refresh()
+
+    def update_many(self, updates, atomic=False, key=None, create=False):
+        # The database transaction serialises writers across processes, so
+        # lock striping buys nothing here; idempotency keys live in the
+        # database so a retry may land on any worker.
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            staged = {}
+            try:
+                self.refresh()
+                outcome = self._seen(conn, key)
+                if outcome is None:
+                    results, staged = self._stage(updates, create)
+                    applied = not atomic or all(isinstance(result, dict) for result in results)
+                    if not applied:
+                        staged = {}
+                    version = self.version
+                    now = now_micros()
+                    for card_id, card in staged.items():
+                        version += 1
+                        card["version"] = version
+                        # Completed sessions are committed with the checkout
+                        entry = ended_session(self.cards.get(card_id), card)
+                        if entry is not None:
+                            conn.execute("INSERT INTO sessions (card_id, entry, exit) VALUES (?, ?, ?)",
+                                         (card_id, entry, now))
+                        conn.execute("INSERT INTO spots (id, data, version) VALUES (?, ?, ?) ON CONFLICT (id) "
+                                     "DO UPDATE SET data = excluded.data, version = excluded.version",
+                                     (card_id, json.dumps(card), version))
+                    if staged:
+                        conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+                    outcome = (results, applied)
+                    self._store_seen(conn, key, outcome)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            for card_id, card in staged.items():
+                self._record(card_id, card, card["version"])
+            return outcome
+
+    def sessions_since(self, seq, limit):
+        # Must be called with the lock held. [(seq, card_id, entry, exit)]
+        # of sessions recorded after `seq`, oldest first.
+        return self._connect().execute("SELECT seq, card_id, entry, exit FROM sessions WHERE seq > ? "
+                                       "ORDER BY seq LIMIT ?", (seq, limit)).fetchall()
+
+    def _seen(self, conn, key):
+        if key is None:
+            return None
+        row = conn.execute("SELECT outcome FROM requests WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        outcome = json.loads(row[0])
+        results = [UpdateRejected(result["rejected"]) if isinstance(result, dict) and "rejected" in result
+                   else result for result in outcome["results"]]
+        return results, outcome["applied"]
+
+    def _store_seen(self, conn, key, outcome):
+        if key is None:
+            return
+        results, applied = outcome
+        results = [{"rejected": str(result)} if isinstance(result, UpdateRejected) else result
+                   for result in results]
+        now = time.time()
+        conn.execute("DELETE FROM requests WHERE created < ?", (now - IDEMPOTENCY_TTL,))
+        conn.execute("INSERT OR REPLACE INTO requests (key, outcome, created) VALUES (?, ?, ?)",
+                     (key, json.dumps({"results": results, "applied": applied}), now))
+
+
+def create_store(url, cards, journal_dir=None):
+    # "memory" (the default) or "sqlite:///path/to/smartpark.db". A journal
+    # directory makes the memory store durable; SQLite already is.
+    if not url or url == "memory":
+        return MemoryStore(cards, Journal(journal_dir) if journal_dir else None)
+    if journal_dir:
+        raise ValueError("SMARTPARK_JOURNAL only applies to the memory store")
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):], cards)
+    raise ValueError(f"Unsupported SMARTPARK_STORE: {url}")
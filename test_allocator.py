@@ -0,0 +1,45 @@
+"""Tests for the free-spot allocator.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+from allocator import Allocator
+
+
+def spot(number, status="empty", zone=None):
+    card = {"id": number, "status": status, "vehicle": "None", "entryTime": None}
+    if zone is not None:
+        card["zone"] = zone
+    return card
+
+
+def test_picks_lowest_free_spot():
+    allocator = Allocator()
+    allocator.load([(str(number), spot(number)) for number in (5, 2, 9)])
+    assert allocator.pick() == "2"
+    assert allocator.pick(exclude={"2"}) == "5"
+
+    allocator.apply("2", spot(2), spot(2, "occupied"))
+    assert allocator.pick() == "5"
+    assert allocator.occupancy()["occupied"] == 1
+
+
+def test_heap_stays_bounded_under_churn():
+    allocator = Allocator()
+    allocator.load([(str(number), spot(number)) for number in range(1, 11)])
+    group = next(iter(allocator.groups.values()))
+    # Writes that leave a spot empty push it again; without compaction each
+    # one would leave another entry behind.
+    for _ in range(1000):
+        allocator.apply("3", spot(3), spot(3))
+        allocator.apply("4", spot(4), spot(4, "occupied"))
+        allocator.apply("4", spot(4, "occupied"), spot(4))
+    assert len(group.heap) <= 2 * len(group.free) + 64
+    assert allocator.pick() == "1"
+
+
+def test_empty_group_is_dropped():
+    allocator = Allocator()
+    allocator.load([("1", spot(1, zone="A")), ("2", spot(2))])
+    allocator.apply("1", spot(1, zone="A"), spot(1))
+    assert list(allocator.occupancy()["zones"]) == ["main"]
+    assert allocator.pick(zone="A") is None
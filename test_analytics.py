@@ -0,0 +1,39 @@
+"""Tests for the session analytics reports.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import numpy as np
+import pytest
+
+from analytics import DAY, HOUR, RANGE_MAX, report
+from spots import parse_time
+
+
+def sessions(*spans):
+    # spans are (entry, exit) ISO times, all on spot "1"
+    return {"entry": np.array([parse_time(entry) for entry, _ in spans], dtype=np.int64),
+            "exit": np.array([parse_time(exit) for _, exit in spans], dtype=np.int64),
+            "spot": np.zeros(len(spans), dtype=np.int32)}
+
+
+def test_hourly_occupancy_and_peak():
+    columns = sessions(("2024-01-01T08:00:00", "2024-01-01T10:00:00"),
+                       ("2024-01-01T09:30:00", "2024-01-01T10:00:00"))
+    result = report(columns, ["1"], None, None, 2)
+    assert result["sessions"] == 2
+    assert result["hourlyOccupancy"][8] == 1.0
+    assert result["hourlyOccupancy"][9] == 1.5
+    assert result["peak"]["cars"] == 2 and result["peak"]["time"] == "2024-01-01T09:30:00"
+    assert result["turnover"]["busiestSpots"] == [{"cardId": "1", "sessions": 2}]
+
+
+def test_range_is_capped():
+    columns = sessions(("2024-01-01T08:00:00", "2024-01-01T10:00:00"))
+    with pytest.raises(ValueError, match="days apart"):
+        report(columns, ["1"], parse_time("0001-01-01"), parse_time("9999-01-01"), 1)
+    # A missing bound stops at RANGE_MAX instead of spanning every hour
+    # back to the epoch
+    result = report(columns, ["1"], None, parse_time("2024-01-02"), 1)
+    assert parse_time("2024-01-02") - parse_time(result["from"]) <= RANGE_MAX + HOUR
+    assert report(columns, ["1"], parse_time("2024-01-01"), None, 1)["to"] == "2024-01-01T11:00:00"
+    assert RANGE_MAX // DAY > 366
@@ -0,0 +1,89 @@
+"""Tests for the store journal: recovery, torn writes and commit failures.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import os
+import time
+
+import pytest
+
+from app import prepare_update
+from journal import SNAPSHOT_NAME, Journal
+from snapshot import MappedSnapshot
+from store import MemoryStore
+
+
+def lot():
+    return {str(number): {"id": number, "status": "empty", "vehicle": "None", "entryTime": None}
+            for number in range(1, 4)}
+
+
+def checkin(vehicle):
+    return prepare_update({"cardId": "0", "action": "checkin", "vehicle": vehicle})[1]
+
+
+def checkout(card):
+    return prepare_update({"cardId": "0", "action": "checkout"})[1](card)
+
+
+def wait_for_snapshot(journal):
+    # Compaction writes the snapshot in a background thread.
+    deadline = time.monotonic() + 10
+    while journal._compacting or not os.path.exists(os.path.join(journal.directory, SNAPSHOT_NAME)):
+        assert time.monotonic() < deadline, "snapshot was not written"
+        time.sleep(0.01)
+
+
+def test_recovers_across_compaction(tmp_path):
+    journal = Journal(str(tmp_path), compact_every=5)
+    store = MemoryStore(lot(), journal)
+    for number in range(12):
+        card_id = str(number % 3 + 1)
+        apply = checkout if store.get(card_id)["status"] == "occupied" else checkin(f"KA-{number}")
+        store.update(card_id, apply)
+        if journal._compacting:
+            wait_for_snapshot(journal)
+    wait_for_snapshot(journal)
+
+    recovered = MemoryStore(lot(), Journal(str(tmp_path), compact_every=5))
+    assert MappedSnapshot(os.path.join(str(tmp_path), SNAPSHOT_NAME)).version < store.version
+    assert recovered.version == store.version == 12
+    assert recovered.as_dict() == store.as_dict()
+
+
+@pytest.mark.parametrize("segment", ["current", "next"])
+def test_torn_line_is_cut_off(tmp_path, segment):
+    store = MemoryStore(lot(), Journal(str(tmp_path)))
+    store.update("1", checkin("KA-1"))
+    store.update("2", checkin("KA-2"))
+    expected = store.as_dict()
+    # A crash mid-write leaves a partial line, either at the end of the
+    # segment in use or as the only bytes of the segment recovery reopens.
+    name = "journal-1.log" if segment == "current" else "journal-3.log"
+    with open(tmp_path / name, "ab") as f:
+        f.write(b'{"v":3,"id":"3","card":{"status":"occ')
+
+    recovered = MemoryStore(lot(), Journal(str(tmp_path)))
+    assert recovered.version == 2
+    assert recovered.as_dict() == expected
+
+    # Writes after the torn line survive the next recovery
+    recovered.update("3", checkin("KA-3"))
+    again = MemoryStore(lot(), Journal(str(tmp_path)))
+    assert again.version == 3
+    assert again.get("3")["vehicle"] == "KA-3"
+
+
+def test_failed_commit_reaches_writers(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path))
+    store = MemoryStore(lot(), journal)
+    store.update("1", checkin("KA-1"))
+
+    def sync():
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(journal, "_sync", sync)
+    with pytest.raises(RuntimeError, match="Journal commit failed"):
+        store.update("2", checkin("KA-2"))
+    # Later writers fail straight away instead of waiting forever
+    with pytest.raises(RuntimeError, match="Journal commit failed"):
+        store.update("3", checkin("KA-3"))
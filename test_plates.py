@@ -0,0 +1,45 @@
+"""Tests for the plate index.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+from plates import PlateIndex
+
+
+def parked(*plates):
+    index = PlateIndex()
+    index.load([(str(number), {"status": "occupied", "vehicle": plate})
+                for number, plate in enumerate(plates, 1)])
+    return index
+
+
+def test_exact_and_prefix_normalise_the_query():
+    index = parked("KA-53-Z-9021", "KA-53-Z-9022", "MH-12-AB-1234")
+    assert index.search("ka 53 z9021", match="exact") == [("KA53Z9021", ["1"])]
+    assert [plate for plate, _ in index.search("ka53", match="prefix")] == ["KA53Z9021", "KA53Z9022"]
+
+
+def test_partial_matches_fragment_anywhere():
+    index = parked("KA-53-Z-9021", "MH-12-AB-1234", "DL-3C-AB-9021")
+    assert [plate for plate, _ in index.search("9021")] == ["DL3CAB9021", "KA53Z9021"]
+
+
+def test_partial_tolerates_one_misread_missing_or_extra_character():
+    index = parked("KA-53-Z-9021", "MH-12-AB-1234")
+    for query in ("53Z8021", "53Z021", "53ZX9021"):
+        assert [plate for plate, _ in index.search(query)] == ["KA53Z9021"], query
+    # Two characters off is not a match
+    assert index.search("53Y8021") == []
+
+
+def test_contains_ranks_ahead_of_fuzzy_matches():
+    index = parked("KA-01-AB-1235", "KA-01-AB-1234")
+    assert [plate for plate, _ in index.search("AB1234")] == ["KA01AB1234", "KA01AB1235"]
+
+
+def test_apply_moves_and_releases_plates():
+    index = parked("KA-53-Z-9021")
+    index.apply("1", {"status": "occupied", "vehicle": "KA-53-Z-9021"}, {"status": "empty", "vehicle": "None"})
+    index.apply("2", None, {"status": "occupied", "vehicle": "KA-53-Z-9021"})
+    assert index.search("Z902") == [("KA53Z9021", ["2"])]
+    index.apply("2", {"status": "occupied", "vehicle": "KA-53-Z-9021"}, {"status": "empty"})
+    assert index.search("Z902") == [] and not index.grams
@@ -0,0 +1,64 @@
+"""Tests for filtered, cursor-paginated status queries.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import pytest
+
+from queries import StatusIndex, decode_cursor, encode_cursor
+
+
+def spot(status="empty", zone=None, entry=None):
+    card = {"status": status, "vehicle": "None", "entryTime": entry}
+    if zone is not None:
+        card["zone"] = zone
+    return card
+
+
+def walk(index, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        card_ids, cursor, total = index.page(cursor=cursor, limit=limit, **filters)
+        pages.append(card_ids)
+        if cursor is None:
+            return pages, total
+        # Cursors go through the client as opaque strings
+        cursor = decode_cursor(encode_cursor(cursor))
+
+
+def test_pages_follow_natural_spot_order():
+    index = StatusIndex()
+    index.load([(card_id, spot(zone="B" if card_id in ("2", "10") else None))
+                for card_id in ("10", "2", "1", "A-1", "3")])
+    assert walk(index, 2) == ([["1", "2"], ["3", "10"], ["A-1"]], 5)
+    assert walk(index, 5, zone="B") == ([["2", "10"]], 2)
+
+
+def test_writes_between_pages_do_not_repeat_spots():
+    index = StatusIndex()
+    index.load([(str(number), spot()) for number in range(1, 7)])
+    card_ids, cursor, _ = index.page(status="empty", limit=3)
+    assert card_ids == ["1", "2", "3"]
+    # Spot 2 is taken and freed again before the next page
+    index.apply("2", spot(), spot("occupied", entry="2024-01-01T08:00:00"))
+    index.apply("2", spot("occupied", entry="2024-01-01T08:00:00"), spot())
+    assert index.page(status="empty", cursor=cursor, limit=3)[0] == ["4", "5", "6"]
+
+
+def test_entry_time_pages():
+    index = StatusIndex()
+    index.load([("1", spot("occupied", entry="2024-01-01T09:00:00")),
+                ("2", spot("occupied", entry="2024-01-01T08:00:00")),
+                ("3", spot("occupied", entry="2024-01-01T08:00:00")),
+                ("4", spot())])
+    before = 1704099600 * 10 ** 6  # 2024-01-01T09:00:00
+    assert walk(index, 1, entered_before=before) == ([["2"], ["3"]], 2)
+    assert index.page(status="empty", entered_before=before) == ([], None, 0)
+
+
+def test_cursor_from_another_view_is_rejected():
+    index = StatusIndex()
+    index.load([("1", spot("occupied", entry="2024-01-01T09:00:00"))])
+    with pytest.raises(ValueError):
+        index.page(entered_after=0, cursor="1")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
@@ -0,0 +1,52 @@
+"""Tests for spot reservations and the availability index.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import copy
+
+import pytest
+
+from reservations import ReservationIndex, release, reserve
+from spots import parse_time
+
+
+def window(start, end):
+    return parse_time(start), parse_time(end)
+
+
+def test_reserve_rejects_overlap():
+    card = {"status": "empty"}
+    reserve(card, *window("2099-01-01T08:00", "2099-01-01T10:00"), "KA-1", None)
+    with pytest.raises(ValueError, match="reserved"):
+        reserve(card, *window("2099-01-01T09:00", "2099-01-01T11:00"), "KA-2", None)
+    reserve(card, *window("2099-01-01T10:00", "2099-01-01T11:00"), "KA-2", None)
+    assert [item["vehicle"] for item in card["reservations"]] == ["KA-1", "KA-2"]
+
+
+def test_reserved_finds_overlapping_spots():
+    short, long = {"status": "empty"}, {"status": "empty"}
+    reserve(short, *window("2099-01-01T08:00", "2099-01-01T09:00"), "KA-1", None)
+    reserve(long, *window("2099-01-01T00:00", "2099-01-03T00:00"), "KA-2", None)
+    index = ReservationIndex()
+    index.load([("1", short), ("2", long)])
+    assert index.reserved(*window("2099-01-01T08:30", "2099-01-01T08:45")) == {"1", "2"}
+    assert index.reserved(*window("2099-01-02T08:00", "2099-01-02T09:00")) == {"2"}
+    assert index.reserved(*window("2099-01-03T00:00", "2099-01-04T00:00")) == set()
+    assert index.spot_of(short["reservations"][0]["id"]) == "1"
+
+
+def test_longest_shrinks_on_release():
+    card = {"status": "empty"}
+    reserve(card, *window("2099-01-01T00:00", "2099-01-20T00:00"), "KA-1", None)
+    index = ReservationIndex()
+    index.load([("1", card)])
+    old = copy.deepcopy(card)
+    reserve(card, *window("2099-02-01T08:00", "2099-02-01T09:00"), "KA-2", None)
+    index.apply("1", old, card)
+    assert index.longest == parse_time("2099-01-20") - parse_time("2099-01-01")
+
+    old = copy.deepcopy(card)
+    release(card, card["reservations"][0]["id"])
+    index.apply("1", old, card)
+    assert index.longest == parse_time("2099-01-01T09:00") - parse_time("2099-01-01T08:00")
+    assert index.reserved(*window("2099-02-01T08:30", "2099-02-01T08:31")) == {"1"}
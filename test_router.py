@@ -0,0 +1,37 @@
+"""Tests for routing requests to facility shards.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import asyncio
+import json
+
+from router import Router
+
+
+def scope(path, query=b"", headers=()):
+    return {"type": "http", "method": "POST", "path": path, "query_string": query, "headers": list(headers)}
+
+
+def test_route_by_prefix_query_or_header():
+    router = Router({"main": "http://main", "north": "http://north"})
+    assert router.route(scope("/facilities/north/api/status")) == ("north", "/api/status")
+    assert router.route(scope("/api/update", b"facility=north")) == ("north", "/api/update")
+    assert router.route(scope("/api/update", headers=[(b"x-facility", b"main")])) == ("main", "/api/update")
+
+
+def test_untagged_request_needs_a_facility_when_there_are_several():
+    assert Router({"main": "http://main"}).route(scope("/api/update")) == ("main", "/api/update")
+    router = Router({"main": "http://main", "north": "http://north"})
+    assert router.route(scope("/api/update")) == (None, "/api/update")
+
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(router(scope("/api/update"), receive, send))
+    assert sent[0]["status"] == 400
+    assert "facility" in json.loads(sent[1]["body"])["error"]
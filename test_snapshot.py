@@ -0,0 +1,34 @@
+"""Tests for the memory-mapped binary snapshot.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+from journal import SNAPSHOT_NAME
+from snapshot import MappedSnapshot, MappedSpots, write_snapshot
+
+
+def test_round_trip(tmp_path):
+    cards = {
+        "1": {"id": 1, "status": "empty", "vehicle": "None", "entryTime": None, "version": 3},
+        "B-2": {"status": "occupied", "vehicle": "KA-53-Z-9021", "entryTime": "2024-01-01T08:00:00",
+                "phone": "+91 98450 00000", "version": 9, "zone": "B", "maxStay": 90.5},
+        "²": {"status": "empty", "vehicle": "None", "entryTime": None},
+    }
+    path = str(tmp_path / SNAPSHOT_NAME)
+    write_snapshot(path, 12, cards)
+
+    snapshot = MappedSnapshot(path)
+    assert snapshot.version == 12
+    spots = MappedSpots(snapshot)
+    assert dict(spots.items()) == cards
+    assert spots.get("B-2") == cards["B-2"]
+    assert spots.get("4") is None
+
+
+def test_writes_layer_over_snapshot(tmp_path):
+    path = str(tmp_path / SNAPSHOT_NAME)
+    write_snapshot(path, 1, {"1": {"status": "empty", "vehicle": "None", "entryTime": None}})
+    spots = MappedSpots(MappedSnapshot(path))
+    spots["1"] = {"status": "occupied", "vehicle": "KA-1", "entryTime": "2024-01-01T08:00:00"}
+    spots["2"] = {"status": "empty", "vehicle": "None", "entryTime": None}
+    assert spots.get("1")["vehicle"] == "KA-1"
+    assert sorted(key for key, _ in spots.items()) == ["1", "2"]
@@ -0,0 +1,33 @@
+"""Tests for the columnar spot table.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import pytest
+
+from spots import SpotTable
+
+
+@pytest.mark.parametrize("fields", [
+    {"zone": "B", "type": "ev", "maxStay": 90},
+    {"maxStay": 90.5},
+    {"maxStay": 90.0},
+    {"maxStay": True},
+    {"zone": 3, "type": None},
+    {"note": "reserved for staff"},
+])
+def test_round_trip(fields):
+    card = {"id": 1, "status": "empty", "vehicle": "None", "entryTime": None, **fields}
+    table = SpotTable([("1", card)])
+    assert table["1"] == card
+    assert {key: type(value) for key, value in table["1"].items()} == \
+        {key: type(value) for key, value in card.items()}
+
+
+def test_columns_replace_extras():
+    table = SpotTable([("1", {"id": 1, "status": "empty", "zone": "B", "type": "ev", "maxStay": 120})])
+    assert not table.extras
+    table["1"] = {"id": 1, "status": "occupied"}
+    assert table["1"] == {"id": 1, "status": "occupied"}
+    # The zone and type strings were released with the old row
+    assert "B" not in table.strings.index and "ev" not in table.strings.index
+    assert dict(table.copy().items()) == dict(table.items())
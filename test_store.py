@@ -0,0 +1,71 @@
+"""Tests for the spot stores.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import pytest
+
+from app import prepare_update
+from store import UpdateRejected, create_store
+
+
+def lot():
+    return {str(number): {"id": number, "status": "empty", "vehicle": "None", "entryTime": None}
+            for number in range(1, 4)}
+
+
+# The /api/update change, applied to whichever spot the test names
+def checkin(vehicle, expected=None):
+    return prepare_update({"cardId": "0", "action": "checkin", "vehicle": vehicle,
+                           "expectedVersion": expected})[1]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    url = "memory" if request.param == "memory" else f"sqlite:///{tmp_path / 'smartpark.db'}"
+    return create_store(url, lot())
+
+
+@pytest.mark.parametrize("second", ["unknown", "rejected"])
+def test_atomic_batch_is_all_or_nothing(store, second):
+    store.update("2", checkin("KA-2"))
+    failing = ("9", checkin("KA-9")) if second == "unknown" else ("2", checkin("KA-3"))
+    with store.lock:
+        before = store.as_dict()
+
+    results, applied = store.update_many([("1", checkin("KA-1")), failing], atomic=True)
+    assert not applied
+    assert isinstance(results[0], dict)
+    if second == "unknown":
+        assert results[1] is None
+    else:
+        assert isinstance(results[1], UpdateRejected)
+    with store.lock:
+        store.refresh()
+        assert store.as_dict() == before
+    assert store.version == 1
+
+    results, applied = store.update_many([("1", checkin("KA-1")), ("3", checkin("KA-3"))], atomic=True)
+    assert applied
+    assert store.get("1")["vehicle"] == "KA-1" and store.get("3")["vehicle"] == "KA-3"
+    assert store.version == 3
+
+
+def test_expected_version_conflict(store):
+    first = store.update("1", checkin("KA-1", expected=0))
+    assert first["version"] == 1
+
+    with pytest.raises(UpdateRejected, match="Version conflict"):
+        store.update("1", checkin("KA-2", expected=0))
+    assert store.get("1")["vehicle"] == "KA-1"
+    assert store.version == 1
+
+
+def test_replayed_idempotency_key(store):
+    results, applied = store.update_many([("1", checkin("KA-1"))], key="gate-1")
+    assert applied and results[0]["vehicle"] == "KA-1"
+
+    # A retry with the same key returns the first outcome and writes nothing
+    replayed = store.update_many([("2", checkin("KA-2"))], key="gate-1")
+    assert replayed == (results, applied)
+    assert store.get("2")["status"] == "empty"
+    assert store.version == 1
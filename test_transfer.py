@@ -0,0 +1,63 @@
+"""Tests for importing and exporting spots.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import io
+
+from queries import StatusIndex
+from store import create_store
+from transfer import export_spots, import_spots
+
+
+def lot():
+    store = create_store("memory", {
+        "1": {"id": 1, "status": "occupied", "vehicle": "KA-1", "entryTime": "2024-01-01T08:00:00", "zone": "A"},
+        "2": {"id": 2, "status": "empty", "vehicle": "None", "entryTime": None},
+    })
+    index = StatusIndex()
+    store.add_index(index)
+    return store, index
+
+
+def test_csv_empty_cells_leave_fields_unchanged():
+    store, _ = lot()
+    summary = import_spots(store, io.StringIO("cardId,zone,vehicle,maxStay\n1,,,90\n"), "csv")
+    assert summary == {"created": 0, "updated": 1, "rejected": 0, "errors": []}
+    assert store.get("1") == {"id": 1, "status": "occupied", "vehicle": "KA-1",
+                              "entryTime": "2024-01-01T08:00:00", "zone": "A", "maxStay": 90,
+                              "version": 1}
+
+
+def test_csv_creates_spots_and_applies_status_rules():
+    store, _ = lot()
+    rows = ("cardId,status,vehicle,entryTime\n"
+            "1,empty,,\n"                        # emptied: the vehicle goes
+            "2,occupied,KA-2,2024-01-01T09:00\n"
+            "B-7,,,\n")                          # new spots start empty
+    summary = import_spots(store, io.StringIO(rows), "csv")
+    assert (summary["created"], summary["updated"]) == (1, 2)
+    assert store.get("1")["vehicle"] == "None" and store.get("1")["entryTime"] is None
+    assert store.get("2")["entryTime"] == "2024-01-01T09:00:00"
+    assert store.get("B-7") == {"status": "empty", "vehicle": "None", "entryTime": None, "version": 3}
+
+
+def test_invalid_rows_are_reported_by_line():
+    store, _ = lot()
+    rows = "cardId,status,maxStay\n1,parked,\n2,,-5\n,empty,\n2,,30,extra\n2,occupied,\n"
+    summary = import_spots(store, io.StringIO(rows), "csv")
+    assert summary["updated"] == 1 and summary["rejected"] == 4
+    assert [error["line"] for error in summary["errors"]] == [2, 3, 4, 5]
+    assert store.get("2")["status"] == "occupied"
+
+
+def test_export_round_trips_through_import():
+    store, index = lot()
+    exported = "".join(export_spots(store, index, "ndjson", chunk_size=1))
+    copy, _ = lot()
+    copy.update("1", lambda card: dict(card, status="empty", vehicle="None", entryTime=None))
+    import_spots(copy, io.StringIO(exported), "ndjson")
+    with store.lock, copy.lock:
+        assert {card_id: {key: value for key, value in card.items() if key != "version"}
+                for card_id, card in copy.as_dict().items()} == \
+            {card_id: {key: value for key, value in card.items() if key != "version"}
+             for card_id, card in store.as_dict().items()}
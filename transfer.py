@@ -0,0 +1,251 @@
+"""Streaming import and export of spots and session history.
+
+Imports read CSV or NDJSON one row at a time and write spots to the store
+in chunks of CHUNK_SIZE, one store.update_many() per chunk, so a file of
+any size is held in memory one chunk at a time. A row creates the spot
+named by its cardId (or id) or updates the fields it carries; in CSV an
+empty cell leaves the field as it is. Rows that fail validation are skipped
+and reported by line number. Chunks are committed as they are read, so a
+failed upload leaves the chunks before it applied.
+
+Exports are generators of text chunks. Spots are walked in natural spot
+order one page of the status index at a time, taking the store lock once
+per page, so writers are never held up for the whole export and the result
+is not a point-in-time snapshot. Session history is sliced from the
+columnar session log, whose arrays later checkouts do not change.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+
+from analytics import MINUTE
+
+CHUNK_SIZE = 1000
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SPOT_COLUMNS = ("cardId", "id", "zone", "type", "status", "vehicle", "phone", "entryTime", "maxStay", "version")
+SESSION_COLUMNS = ("cardId", "entryTime", "exitTime", "minutes")
+# Errors listed in an import result; the rest are only counted
+ERRORS_MAX = 100
+
+
+def detect_format(name=None, content_type=None):
+    # Format from an explicit name, a Content-Type or a file name, or None.
+    if name in FORMATS:
+        return name
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-seq"):
+        return "ndjson"
+    if name:
+        for fmt, suffixes in (("csv", (".csv",)), ("ndjson", (".ndjson", ".jsonl"))):
+            if name.lower().endswith(suffixes):
+                return fmt
+    return None
+
+
+def read_rows(lines, fmt):
+    # Yields (line number, record dict or ValueError) from a text stream.
+    if fmt == "csv":
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) > len(header):
+                yield reader.line_num, ValueError(f"expected {len(header)} columns, got {len(row)}")
+                continue
+            # Empty cells are absent fields
+            yield reader.line_num, {name: cell for name, cell in zip(header, row) if cell != ""}
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield number, ValueError("expected a JSON object")
+            continue
+        yield number, record
+
+
+def parse_spot(record):
+    # (card_id, fields) from an imported record; raises ValueError. CSV
+    # cells arrive as strings, so numbers are converted here.
+    card_id = record.get("cardId", record.get("id"))
+    if card_id is None or str(card_id).strip() == "":
+        raise ValueError("cardId is required")
+    card_id = str(card_id).strip()
+    fields = {}
+    if record.get("id") is not None:
+        try:
+            fields["id"] = int(record["id"])
+        except (TypeError, ValueError):
+            raise ValueError("id must be an integer")
+    for name in ("zone", "type", "vehicle", "phone"):
+        if record.get(name) is not None:
+            fields[name] = str(record[name])
+    status = record.get("status")
+    if status is not None:
+        if status not in ("empty", "occupied"):
+            raise ValueError("status must be empty or occupied")
+        fields["status"] = status
+    if record.get("entryTime") is not None:
+        try:
+            parsed = datetime.fromisoformat(str(record["entryTime"]))
+        except ValueError:
+            raise ValueError("entryTime must be an ISO time")
+        if parsed.tzinfo is not None:
+            raise ValueError("entryTime must not carry a timezone")
+        fields["entryTime"] = parsed.isoformat()
+    if record.get("maxStay") is not None:
+        try:
+            max_stay = float(record["maxStay"])
+        except (TypeError, ValueError):
+            raise ValueError("maxStay must be a number of minutes")
+        if max_stay <= 0:
+            raise ValueError("maxStay must be positive")
+        fields["maxStay"] = int(max_stay) if max_stay.is_integer() else max_stay
+    return card_id, fields
+
+
+def merge_spot(card_id, card, fields, now):
+    # The spot after an import row: new spots start empty, a spot left empty
+    # has no vehicle, like after a checkout, and a vehicle parked without an
+    # entryTime entered `now`.
+    if not card:
+        card = {"id": int(card_id) if card_id.isdecimal() else None, "status": "empty", "vehicle": "None",
+                "entryTime": None}
+        if card["id"] is None:
+            del card["id"]
+    parked = card["status"] == "occupied" and card.get("vehicle")
+    card.update(fields)
+    if card["status"] == "empty":
+        card["vehicle"] = "None"
+        card["entryTime"] = None
+    elif "entryTime" not in fields and (card.get("entryTime") is None or card.get("vehicle") != parked):
+        card["entryTime"] = now
+    return card
+
+
+def import_spots(store, lines, fmt, chunk_size=CHUNK_SIZE):
+    # Creates or updates spots from a text stream; returns a summary.
+    summary = {"created": 0, "updated": 0, "rejected": 0, "errors": []}
+
+    def flush(chunk):
+        now = datetime.now().isoformat()
+        created = set()
+
+        def upsert(card_id, fields):
+            def apply(card):
+                if not card:
+                    created.add(card_id)
+                return merge_spot(card_id, card, fields, now)
+            return card_id, apply
+
+        store.update_many([upsert(card_id, fields) for card_id, fields in chunk], create=True)
+        summary["created"] += len(created)
+        summary["updated"] += len(chunk) - len(created)
+
+    chunk = []
+    for number, record in read_rows(lines, fmt):
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            chunk.append(parse_spot(record))
+        except ValueError as e:
+            summary["rejected"] += 1
+            if len(summary["errors"]) < ERRORS_MAX:
+                summary["errors"].append({"line": number, "error": str(e)})
+            continue
+        if len(chunk) == chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return summary
+
+
+def iter_spots(store, index, chunk_size=CHUNK_SIZE):
+    # Yields (card_id, card) in natural spot order, one StatusIndex page
+    # per store lock.
+    cursor = None
+    while True:
+        with store.lock:
+            store.refresh()
+            card_ids, cursor, _ = index.page(cursor=cursor, limit=chunk_size)
+            cards = [(card_id, store.cards[card_id]) for card_id in card_ids]
+        yield from cards
+        if cursor is None:
+            return
+
+
+def export_spots(store, index, fmt, chunk_size=CHUNK_SIZE):
+    # Yields the lot as CSV (SPOT_COLUMNS) or NDJSON (whole spots, with a
+    # cardId field) in chunks of text.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if fmt == "csv":
+        writer.writerow(SPOT_COLUMNS)
+    count = 0
+    for card_id, card in iter_spots(store, index, chunk_size):
+        if fmt == "csv":
+            writer.writerow([card_id] + ["" if card.get(name) is None else card[name] for name in SPOT_COLUMNS[1:]])
+        else:
+            buffer.write(json.dumps({"cardId": card_id, **card}, separators=(",", ":")))
+            buffer.write("\n")
+        count += 1
+        if count % chunk_size == 0:
+            yield drain(buffer)
+    yield drain(buffer)
+
+
+def export_sessions(columns, keys, fmt, start=None, end=None, chunk_size=10 * CHUNK_SIZE):
+    # Yields completed sessions (from SessionLog.snapshot()) exiting in
+    # [start, end) as CSV or NDJSON chunks, oldest first.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if fmt == "csv":
+        writer.writerow(SESSION_COLUMNS)
+        yield drain(buffer)
+    keys = np.array(keys, dtype=object)
+    for offset in range(0, len(columns["entry"]), chunk_size):
+        entries = columns["entry"][offset:offset + chunk_size]
+        exits = columns["exit"][offset:offset + chunk_size]
+        spots = columns["spot"][offset:offset + chunk_size]
+        selected = np.ones(len(exits), bool)
+        if start is not None:
+            selected &= exits >= start
+        if end is not None:
+            selected &= exits < end
+        if not selected.any():
+            continue
+        entries, exits, spots = entries[selected], exits[selected], spots[selected]
+        rows = zip(keys[spots].tolist(),
+                   np.datetime_as_string(entries.astype("datetime64[us]")).tolist(),
+                   np.datetime_as_string(exits.astype("datetime64[us]")).tolist(),
+                   np.round((exits - entries) / MINUTE, 2).tolist())
+        if fmt == "csv":
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(SESSION_COLUMNS, row)), separators=(",", ":")))
+                buffer.write("\n")
+        yield drain(buffer)
+
+
+def drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text